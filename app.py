@@ -1,11 +1,44 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, Response, render_template, stream_template, request, redirect, url_for, flash, session, jsonify, g
+from flask import before_render_template, template_rendered
 import os
+import io
+import csv
+import json
+import math
+import base64
+import time
+import queue
+import atexit
+import cProfile
 import pandas as pd
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from contextlib import contextmanager
 import unicodedata
+import re
+import bisect
+import heapq
+import calendar
+import sqlite3
+import tempfile
+import threading
+from array import array
+import uuid
+import click
 from openpyxl import load_workbook, Workbook
 from openpyxl.utils.dataframe import dataframe_to_rows
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    import python_calamine
+    MOTOR_EXCEL = "calamine"
+except ImportError:  # sem o motor opcional, as planilhas são lidas com openpyxl (read_only)
+    MOTOR_EXCEL = None
+
 app = Flask(__name__)
 app.secret_key = 'chave_secreta_para_flash_e_session_sgv_2025'
 
@@ -18,20 +51,111 @@ def normalizar_string(texto):
         return ""
     return unicodedata.normalize('NFD', texto).encode('ascii', 'ignore').decode('ascii').lower()
 
+# Log em segundo plano: registrar_log só enfileira a linha; uma thread grava
+# em lotes (até LOTE_LOG linhas ou INTERVALO_LOG segundos) e rotaciona o
+# arquivo por tamanho ou na troca do dia.
+ARQUIVO_LOG = "vendas_log.txt"
+TAMANHO_MAXIMO_LOG = 5 * 1024 * 1024
+LOTE_LOG = 200
+INTERVALO_LOG = 1.0
+
+_fila_log = queue.Queue()
+_thread_log = None
+_lock_thread_log = threading.Lock()
+
 def registrar_log(acao):
-    """Registra ações no log com timestamp (append)."""
+    """Registra ações no log com timestamp (append em segundo plano)."""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    _fila_log.put(f"[{timestamp}] {acao}\n")
+    if _thread_log is None or not _thread_log.is_alive():
+        _iniciar_escritor_log()
+
+def _iniciar_escritor_log():
+    """Inicia a thread que grava o log (também após um fork do processo)."""
+    global _thread_log
+    with _lock_thread_log:
+        if _thread_log is None or not _thread_log.is_alive():
+            _thread_log = threading.Thread(target=_escritor_log, name="escritor-log", daemon=True)
+            _thread_log.start()
+
+def _escritor_log():
+    """Consome a fila do log e grava as linhas em lotes."""
+    encerrar = False
+    while not encerrar:
+        primeira = _fila_log.get()
+        lote = []
+        if primeira is None:
+            encerrar = True
+        else:
+            lote.append(primeira)
+            prazo = time.monotonic() + INTERVALO_LOG
+            while len(lote) < LOTE_LOG:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    linha = _fila_log.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if linha is None:
+                    encerrar = True
+                    break
+                lote.append(linha)
+        try:
+            if lote:
+                _gravar_lote_log(lote)
+        finally:
+            for _ in range(len(lote) + (1 if encerrar else 0)):
+                _fila_log.task_done()
+
+def _gravar_lote_log(linhas):
+    """Grava um lote de linhas no arquivo de log, rotacionando se preciso."""
     try:
-        with open("vendas_log.txt", "a", encoding="utf-8") as arquivo_log:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            arquivo_log.write(f"[{timestamp}] {acao}\n")
+        rotacionar_log()
+    except Exception as e:  # falha na rotação não pode descartar o lote
+        print(f"Erro ao rotacionar log: {e}")
+    try:
+        with open(ARQUIVO_LOG, "a", encoding="utf-8") as arquivo_log:
+            arquivo_log.writelines(linhas)
     except Exception as e:
         print(f"Erro ao registrar log: {e}")
 
+def rotacionar_log():
+    """Renomeia o log para vendas_log.AAAA-MM-DD[.N].txt se passou do tamanho ou do dia."""
+    try:
+        info = os.stat(ARQUIVO_LOG)
+    except OSError:
+        return
+    dia_arquivo = date.fromtimestamp(info.st_mtime)
+    if info.st_size < TAMANHO_MAXIMO_LOG and dia_arquivo == date.today():
+        return
+    
+    base = f"vendas_log.{dia_arquivo.isoformat()}"
+    destino = f"{base}.txt"
+    contador = 1
+    while os.path.exists(destino):
+        destino = f"{base}.{contador}.txt"
+        contador += 1
+    os.replace(ARQUIVO_LOG, destino)
+
+def descarregar_log():
+    """Bloqueia até que todas as linhas enfileiradas tenham sido gravadas."""
+    if _thread_log is not None and _thread_log.is_alive():
+        _fila_log.join()
+
+def encerrar_log():
+    """Grava o que restar na fila e encerra a thread do log (chamado na saída)."""
+    if _thread_log is not None and _thread_log.is_alive():
+        _fila_log.put(None)
+        _thread_log.join(timeout=10)
+
+atexit.register(encerrar_log)
+
 def validar_numero_positivo(valor):
-    """Valida se um valor numérico é positivo ou zero."""
+    """Valida se um valor numérico é finito e positivo ou zero."""
     try:
         valor_float = float(valor)
-        if valor_float < 0:
+        if not math.isfinite(valor_float) or valor_float < 0:
             return None
         return valor_float
     except (ValueError, TypeError):
@@ -41,131 +165,856 @@ def obter_data_atual():
     """Retorna data atual no formato YYYY-MM-DD."""
     return date.today().isoformat()
 
+def salvar_workbook(wb, caminho, preservar=()):
+    """Salva o workbook num arquivo temporário e o renomeia sobre o destino (troca atômica).
+    
+    As chaves do repositório em `preservar` (dados de outras abas, que esta
+    gravação não altera) continuam em memória se estavam atualizadas.
+    """
+    atualizadas = chaves_atualizadas(preservar, [caminho])
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    descritor, temporario = tempfile.mkstemp(prefix=".tmp_", suffix=".xlsx", dir=diretorio)
+    os.close(descritor)
+    try:
+        with medir_tempo("sgv_planilha_gravacao_segundos", arquivo=caminho):
+            wb.save(temporario)
+            os.replace(temporario, caminho)
+        renovar_assinaturas(atualizadas, [caminho])
+        for ws in wb.worksheets:
+            incrementar("sgv_planilha_linhas_gravadas_total", max(ws.max_row - 1, 0), arquivo=caminho, aba=ws.title)
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+_travas_da_thread = threading.local()
+
+@contextmanager
+def bloqueio_arquivo(caminho):
+    """Trava exclusiva entre processos usando o arquivo auxiliar caminho + '.lock'.
+    
+    É reentrante dentro da mesma thread: blocos aninhados sobre o mesmo
+    arquivo reaproveitam a trava já obtida.
+    """
+    caminho_trava = os.path.abspath(caminho) + ".lock"
+    abertas = getattr(_travas_da_thread, "abertas", None)
+    if abertas is None:
+        abertas = _travas_da_thread.abertas = {}
+    if caminho_trava in abertas:
+        abertas[caminho_trava] += 1
+        try:
+            yield
+        finally:
+            abertas[caminho_trava] -= 1
+        return
+    
+    with open(caminho_trava, "a+") as arquivo_trava:
+        if fcntl:
+            fcntl.flock(arquivo_trava.fileno(), fcntl.LOCK_EX)
+        else:
+            arquivo_trava.seek(0)
+            msvcrt.locking(arquivo_trava.fileno(), msvcrt.LK_LOCK, 1)
+        abertas[caminho_trava] = 1
+        try:
+            yield
+        finally:
+            del abertas[caminho_trava]
+            if fcntl:
+                fcntl.flock(arquivo_trava.fileno(), fcntl.LOCK_UN)
+            else:
+                arquivo_trava.seek(0)
+                msvcrt.locking(arquivo_trava.fileno(), msvcrt.LK_UNLCK, 1)
+
+# Dia de trabalho corrente, mantido em memória. O arquivo ultima_data.txt só
+# é lido e gravado quando a data do relógio muda.
+_dia_corrente = None
+_lock_reset = threading.Lock()
+
 def verificar_reset_diario():
     """Verifica se é um novo dia e reseta vendas diárias se necessário."""
+    global _dia_corrente
+    data_atual = obter_data_atual()
+    if data_atual == _dia_corrente:
+        return
+    
+    with _lock_reset:
+        if data_atual == _dia_corrente:
+            return
+        try:
+            with bloqueio_arquivo("ultima_data.txt"):
+                if os.path.exists("ultima_data.txt"):
+                    with open("ultima_data.txt", "r") as f:
+                        ultima_data = f.read().strip()
+                else:
+                    ultima_data = None
+                
+                if ultima_data and ultima_data != data_atual:
+                    arquivar_vendas_diarias(ultima_data)
+                    registrar_log(f"Reset diário: Vendas de {ultima_data} arquivadas")
+                
+                if ultima_data != data_atual:
+                    with open("ultima_data.txt", "w") as f:
+                        f.write(data_atual)
+            
+            descartar_dias_anteriores(data_atual)
+            
+            _dia_corrente = data_atual
+        
+        except Exception as e:
+            registrar_log(f"Erro no reset diário: {str(e)}")
+
+def agendar_virada_do_dia():
+    """Agenda verificar_reset_diario para logo após a próxima meia-noite."""
+    agora = datetime.now()
+    meia_noite = datetime.combine(agora.date() + timedelta(days=1), datetime.min.time())
+    timer = threading.Timer((meia_noite - agora).total_seconds() + 1, _executar_virada_do_dia)
+    timer.daemon = True
+    timer.start()
+
+def _executar_virada_do_dia():
+    """Executa a virada do dia agendada e agenda a próxima."""
+    verificar_reset_diario()
+    agendar_virada_do_dia()
+
+def arquivar_vendas_diarias(data_arquivamento):
+    """Move as vendas do diario para a partição mensal do histórico (historico_AAAA_MM).
+    
+    A cópia e a limpeza do diario acontecem na mesma transação e só até o
+    maior id lido no início, e só para datas anteriores a hoje: vendas
+    gravadas durante a virada ficam no diario. Em caso de erro nada é apagado
+    e a exceção é repassada.
+    """
+    conexao = conectar_banco()
+    filtro = "id <= ? AND (Data IS NULL OR Data < ?)"
+    hoje = obter_data_atual()
+    try:
+        with conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            maior_id = conexao.execute("SELECT MAX(id) FROM diario").fetchone()[0]
+            if maior_id is None:
+                return
+            arquivadas = 0
+            meses = [linha[0] for linha in conexao.execute(
+                f"SELECT DISTINCT substr(Data, 1, 7) FROM diario WHERE {filtro}", (maior_id, hoje)
+            )]
+            for mes in meses:
+                tabela = garantir_particao_historico(conexao, mes_da_data(mes))
+                cursor = conexao.execute(
+                    f"INSERT INTO {tabela} ({', '.join(COLUNAS_VENDA)}) "
+                    f"SELECT {', '.join(COLUNAS_VENDA)} FROM diario "
+                    f"WHERE substr(Data, 1, 7) IS ? AND {filtro} ORDER BY id",
+                    (mes, maior_id, hoje)
+                )
+                arquivadas += cursor.rowcount
+            conexao.execute(f"DELETE FROM diario WHERE {filtro}", (maior_id, hoje))
+    except Exception as e:
+        registrar_log(f"Erro ao arquivar vendas: {str(e)}")
+        raise
+    finally:
+        invalidar_prefixo("vendas:")
+    registrar_log(f"Vendas de {data_arquivamento} arquivadas ({arquivadas} linhas)")
+
+# ---------------------------------------------------------------------
+# MÓDULO: MÉTRICAS
+#
+# Contadores e histogramas em memória, expostos em /metrics no formato texto
+# do Prometheus. Cada worker tem os seus (o Prometheus soma por instância).
+# Com SGV_PERFIL_LENTO=<segundos>, cada requisição roda sob cProfile e as
+# que passarem do limite têm o perfil salvo em SGV_PASTA_PERFIS.
+
+LIMITES_HISTOGRAMA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PERFIL_LENTO = float(os.environ.get("SGV_PERFIL_LENTO", "0"))
+PASTA_PERFIS = os.environ.get("SGV_PASTA_PERFIS", "perfis")
+
+DESCRICOES_METRICAS = {
+    "sgv_requisicao_segundos": ("histogram", "Duração das requisições por rota, método e status."),
+    "sgv_etapa_segundos": ("histogram", "Duração de etapas internas da requisição."),
+    "sgv_template_segundos": ("histogram", "Tempo de renderização por template."),
+    "sgv_planilha_aberturas_total": ("counter", "Aberturas de workbook por arquivo e modo."),
+    "sgv_planilha_leitura_segundos": ("histogram", "Tempo de leitura por arquivo e aba."),
+    "sgv_planilha_carga_segundos": ("histogram", "Tempo de carga completa (para edição) por arquivo."),
+    "sgv_planilha_gravacao_segundos": ("histogram", "Tempo de gravação por arquivo."),
+    "sgv_planilha_linhas_lidas_total": ("counter", "Linhas lidas das planilhas por arquivo e aba."),
+    "sgv_planilha_linhas_gravadas_total": ("counter", "Linhas gravadas nas planilhas por arquivo e aba."),
+    "sgv_banco_linhas_lidas_total": ("counter", "Linhas de venda lidas do vendas.db."),
+    "sgv_banco_linhas_gravadas_total": ("counter", "Linhas de venda gravadas no vendas.db por tabela."),
+    "sgv_cache_consultas_total": ("counter", "Consultas ao repositório em memória (acerto ou falta)."),
+}
+
+_contadores = {}
+_histogramas = {}
+_lock_metricas = threading.Lock()
+
+def incrementar(nome, valor=1, **rotulos):
+    """Soma valor ao contador nome com os rótulos dados."""
+    chave = tuple(sorted(rotulos.items()))
+    with _lock_metricas:
+        serie = _contadores.setdefault(nome, {})
+        serie[chave] = serie.get(chave, 0) + valor
+
+def observar(nome, segundos, **rotulos):
+    """Registra uma duração no histograma nome com os rótulos dados."""
+    chave = tuple(sorted(rotulos.items()))
+    with _lock_metricas:
+        serie = _histogramas.setdefault(nome, {})
+        if chave not in serie:
+            serie[chave] = {"baldes": [0] * (len(LIMITES_HISTOGRAMA) + 1), "soma": 0.0, "contagem": 0}
+        histograma = serie[chave]
+        histograma["baldes"][bisect.bisect_left(LIMITES_HISTOGRAMA, segundos)] += 1
+        histograma["soma"] += segundos
+        histograma["contagem"] += 1
+
+@contextmanager
+def medir_tempo(nome, **rotulos):
+    """Observa no histograma nome o tempo gasto dentro do bloco."""
+    inicio = time.perf_counter()
     try:
-        if os.path.exists("ultima_data.txt"):
-            with open("ultima_data.txt", "r") as f:
-                ultima_data = f.read().strip()
+        yield
+    finally:
+        observar(nome, time.perf_counter() - inicio, **rotulos)
+
+def _formatar_rotulos(rotulos, extra=()):
+    """Rótulos no formato {a="x",b="y"}, escapando barras, aspas e quebras de linha."""
+    pares = list(rotulos) + list(extra)
+    if not pares:
+        return ""
+    escapados = []
+    for chave, valor in pares:
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escapados.append(f'{chave}="{valor}"')
+    return "{" + ",".join(escapados) + "}"
+
+def formatar_metricas():
+    """Todas as métricas no formato texto de exposição do Prometheus."""
+    linhas = []
+    with _lock_metricas:
+        for nome in sorted(set(_contadores) | set(_histogramas)):
+            tipo, descricao = DESCRICOES_METRICAS.get(nome, ("counter" if nome in _contadores else "histogram", ""))
+            linhas.append(f"# HELP {nome} {descricao}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            for rotulos, valor in sorted(_contadores.get(nome, {}).items()):
+                linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {valor}")
+            for rotulos, histograma in sorted(_histogramas.get(nome, {}).items()):
+                acumulado = 0
+                for limite, quantidade in zip(LIMITES_HISTOGRAMA + ("+Inf",), histograma["baldes"]):
+                    acumulado += quantidade
+                    linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos, [('le', limite)])} {acumulado}")
+                linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {histograma['soma']}")
+                linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {histograma['contagem']}")
+    return "\n".join(linhas) + "\n"
+
+def abrir_workbook(caminho):
+    """load_workbook completo (para edição), com tempo e contagem nas métricas."""
+    incrementar("sgv_planilha_aberturas_total", arquivo=caminho, modo="edicao")
+    with medir_tempo("sgv_planilha_carga_segundos", arquivo=caminho):
+        return load_workbook(caminho)
+
+# ---------------------------------------------------------------------
+# MÓDULO: LEITURA DE PLANILHAS
+#
+# Cada arquivo é aberto uma vez em modo somente leitura e todas as abas que
+# o app usa dele são lidas nessa mesma abertura. As abas ainda não pedidas
+# ficam guardadas até serem consumidas (ou até o arquivo mudar). Se o
+# python-calamine estiver instalado, a leitura usa esse motor.
+
+ABAS_POR_ARQUIVO = {
+    "estoque.xlsx": ["Produtos"],
+    "vendas.xlsx": ["Clientes", "Fechamento_Caixa"],
+    "gastos.xlsx": ["Gastos_Fixos", "Gastos_Variaveis"],
+}
+
+_COLUNAS_VENDA_NUMERICAS = ["Cliente_ID", "Quantidade_Input", "Quantidade_Total", "Valor_Unitario", "Valor_Total"]
+_COLUNAS_VENDA_TEXTO = ["Cliente_Nome", "Produto_Nome", "Tipo_Produto", "Forma_Pagamento", "Status_Pagamento", "Data"]
+
+TIPOS_ABAS = {
+    "Produtos": {"ID": "numero", "Nome": "texto", "Tipo": "texto", "Valor": "numero",
+                 "Controlar_Estoque": "texto", "Quantidade": "numero", "Corredor": "numero",
+                 "Prateleira": "numero"},
+    "Clientes": {"ID": "numero", "Nome": "texto", "Telefone": "texto", "Observacoes": "texto"},
+    "Fechamento_Caixa": {"Data": "texto", "Total_Vendas": "numero", "Total_Pago": "numero",
+                         "Total_Pendente": "numero", "PIX": "numero", "Cartao": "numero",
+                         "Deposito": "numero", "Dinheiro": "numero", "Total_Recebido": "numero",
+                         "Diferenca": "numero"},
+    "Gastos_Fixos": {"ID": "numero", "Descricao": "texto", "Valor": "numero", "Data_Vencimento": "texto"},
+    "Gastos_Variaveis": {"ID": "numero", "Descricao": "texto", "Valor": "numero",
+                         "Quantidade": "numero", "Data": "texto"},
+}
+for _aba in ("Diario", "Historico_Vendas"):
+    TIPOS_ABAS[_aba] = dict({c: "numero" for c in _COLUNAS_VENDA_NUMERICAS},
+                            **{c: "texto" for c in _COLUNAS_VENDA_TEXTO})
+
+_abas_pendentes = {}
+_lock_leitura = threading.Lock()
+
+def _converter_tipos(df, aba):
+    """Aplica os tipos de TIPOS_ABAS às colunas presentes na aba.
+    
+    Colunas "numero" viram int64 (se todas forem inteiras) ou float64, com
+    texto inválido como NaN; colunas "texto" ficam como object.
+    """
+    for coluna, tipo in TIPOS_ABAS.get(aba, {}).items():
+        if coluna not in df.columns:
+            continue
+        if tipo == "numero":
+            df[coluna] = pd.to_numeric(df[coluna], errors="coerce")
         else:
-            ultima_data = None
-        
-        data_atual = obter_data_atual()
+            df[coluna] = df[coluna].astype(object)
+    return df
+
+def dataframe_da_aba(ws, dtype=None):
+    """Converte uma aba do openpyxl em DataFrame, usando a primeira linha como cabeçalho."""
+    linhas = ws.iter_rows(values_only=True)
+    cabecalho = next(linhas, None)
+    if not cabecalho:
+        return pd.DataFrame()
+    largura = len(cabecalho)
+    while largura and cabecalho[largura - 1] is None:
+        largura -= 1
+    dados = []
+    for linha in linhas:
+        linha = tuple(linha[:largura])
+        if any(valor is not None for valor in linha):
+            dados.append(linha + (None,) * (largura - len(linha)))
+    return pd.DataFrame(dados, columns=list(cabecalho[:largura]), dtype=dtype)
+
+def _ler_aba_medida(caminho, aba, ler):
+    """Executa ler() medindo tempo e linhas da aba."""
+    with medir_tempo("sgv_planilha_leitura_segundos", arquivo=caminho, aba=aba):
+        df = _converter_tipos(ler(), aba)
+    incrementar("sgv_planilha_linhas_lidas_total", len(df), arquivo=caminho, aba=aba)
+    return df
+
+def ler_planilha(caminho, abas):
+    """Lê as abas pedidas numa única abertura do arquivo; as que não existem ficam de fora."""
+    incrementar("sgv_planilha_aberturas_total", arquivo=caminho, modo="leitura")
+    if MOTOR_EXCEL:
+        with pd.ExcelFile(caminho, engine=MOTOR_EXCEL) as arquivo:
+            return {aba: _ler_aba_medida(caminho, aba, lambda: arquivo.parse(aba))
+                    for aba in abas if aba in arquivo.sheet_names}
+    wb = load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        return {aba: _ler_aba_medida(caminho, aba, lambda: dataframe_da_aba(wb[aba]))
+                for aba in abas if aba in wb.sheetnames}
+    finally:
+        wb.close()
+
+def ler_aba(caminho, aba):
+    """Retorna a aba como DataFrame (ou None se não existir).
+    
+    Na primeira leitura, as outras abas de ABAS_POR_ARQUIVO são lidas junto
+    e ficam pendentes para a próxima chamada, desde que o arquivo não mude.
+    """
+    with _lock_leitura:
+        assinatura = assinatura_arquivos([caminho])
+        pendentes = _abas_pendentes.get(caminho)
+        if pendentes and pendentes["assinatura"] == assinatura and aba in pendentes["abas"]:
+            return pendentes["abas"].pop(aba)
         
-        if ultima_data and ultima_data != data_atual:
-            arquivar_vendas_diarias(ultima_data)
-            limpar_vendas_diarias()
-            registrar_log(f"Reset diário: Vendas de {ultima_data} arquivadas")
+        abas = ABAS_POR_ARQUIVO.get(caminho, [])
+        lidas = ler_planilha(caminho, abas if aba in abas else [aba])
+        df = lidas.pop(aba, None)
+        faltantes = set(abas) - {aba}
+        _abas_pendentes[caminho] = {
+            "assinatura": assinatura,
+            "abas": {nome: lidas.get(nome) for nome in faltantes}
+        }
+        return df
+
+# ---------------------------------------------------------------------
+# MÓDULO: REPOSITÓRIO EM MEMÓRIA
+#
+# Mantém em memória produtos, clientes, gastos, fechamentos e vendas. Cada
+# conjunto guarda a assinatura (mtime, tamanho, inode) dos arquivos de onde
+# veio e uma versão incrementada a cada escrita do próprio app. Enquanto nada
+# muda, as páginas leem só da memória; se um arquivo for alterado por fora
+# (outro worker do gunicorn ou edição manual), o conjunto é recarregado na
+# próxima leitura.
+
+_repositorio = {}
+_lock_repositorio = threading.RLock()
+
+def assinatura_arquivos(arquivos):
+    """Retorna (mtime, tamanho, inode) de cada arquivo, ou None se não existir.
+    
+    O inode muda a cada troca atômica feita por salvar_workbook, então a
+    escrita de outro worker é notada mesmo com mtime e tamanho iguais.
+    """
+    assinatura = []
+    for caminho in arquivos:
+        try:
+            info = os.stat(caminho)
+            assinatura.append((info.st_mtime_ns, info.st_size, info.st_ino))
+        except OSError:
+            assinatura.append(None)
+    return tuple(assinatura)
+
+def obter_dados(chave, arquivos, carregar):
+    """Retorna os dados da chave, chamando carregar() só se os arquivos mudaram."""
+    with _lock_repositorio:
+        assinatura = assinatura_arquivos(arquivos)
+        entrada = _repositorio.get(chave)
+        conjunto = ":".join(chave.split(":")[:2])
+        if entrada and entrada["assinatura"] == assinatura and "dados" in entrada:
+            incrementar("sgv_cache_consultas_total", conjunto=conjunto, resultado="acerto")
+            return entrada["dados"]
         
-        with open("ultima_data.txt", "w") as f:
-            f.write(data_atual)
+        incrementar("sgv_cache_consultas_total", conjunto=conjunto, resultado="falta")
+        dados = carregar()
+        versao = entrada["versao"] + 1 if entrada else 1
+        _repositorio[chave] = {"assinatura": assinatura, "versao": versao, "dados": dados}
+        return dados
+
+def registrar_escrita(chave, arquivos, dados=None):
+    """Incrementa a versão da chave após uma escrita do app.
     
-    except Exception as e:
-        registrar_log(f"Erro no reset diário: {str(e)}")
+    Se dados for informado, ele passa a ser o conteúdo em memória com a
+    assinatura atual dos arquivos; senão a chave é recarregada na próxima leitura.
+    """
+    with _lock_repositorio:
+        entrada = _repositorio.get(chave, {"versao": 0})
+        nova = {"versao": entrada["versao"] + 1, "assinatura": None}
+        if dados is not None:
+            nova["assinatura"] = assinatura_arquivos(arquivos)
+            nova["dados"] = dados
+        _repositorio[chave] = nova
 
-def arquivar_vendas_diarias(data_arquivamento):
-    """Arquiva vendas do dia em aba Historico_Vendas."""
-    try:
-        vendas = carregar_vendas_diarias()
-        if not vendas:
+def chaves_atualizadas(chaves, arquivos):
+    """Das chaves informadas, as que têm dados carregados da versão atual dos arquivos."""
+    with _lock_repositorio:
+        assinatura = assinatura_arquivos(arquivos)
+        return [chave for chave in chaves
+                if chave in _repositorio and _repositorio[chave]["assinatura"] == assinatura
+                and "dados" in _repositorio[chave]]
+
+def renovar_assinaturas(chaves, arquivos):
+    """Marca as chaves como atualizadas após uma gravação que não mexeu nos seus dados."""
+    with _lock_repositorio:
+        assinatura = assinatura_arquivos(arquivos)
+        for chave in chaves:
+            if chave in _repositorio and "dados" in _repositorio[chave]:
+                _repositorio[chave]["assinatura"] = assinatura
+
+def invalidar_prefixo(prefixo):
+    """Força recarga de todas as chaves que começam com o prefixo (e libera os dados)."""
+    with _lock_repositorio:
+        for chave, entrada in _repositorio.items():
+            if chave.startswith(prefixo):
+                entrada["assinatura"] = None
+                entrada["versao"] += 1
+                entrada.pop("dados", None)
+
+def descartar_dias_anteriores(hoje):
+    """Remove do repositório as chaves de datas anteriores a hoje (terminadas em :AAAA-MM-DD)."""
+    with _lock_repositorio:
+        for chave in list(_repositorio):
+            data = re.search(r":(\d{4}-\d{2}-\d{2})$", chave)
+            if data and data.group(1) < hoje:
+                del _repositorio[chave]
+
+class IndiceBusca:
+    """Índice de busca por prefixo de palavra e por trigramas sobre o nome (sem acentos) e o telefone.
+    
+    Buscas com menos de 3 caracteres usam o prefixo das palavras (lista
+    ordenada + bisect); as demais cruzam os trigramas do termo. Se nenhum
+    registro contiver o termo, devolve os mais parecidos (busca aproximada).
+    Os textos também ficam numa lista ordenada: quando há registros
+    suficientes começando pelo termo, eles saem direto dela, sem juntar e
+    ordenar todos os candidatos.
+    """
+    
+    def __init__(self, registros=()):
+        self.textos = {}
+        self.trigramas = {}
+        self.palavras = []
+        self.ordenados = []
+        for registro in registros:
+            self._adicionar_texto(registro["id"], self._texto(registro))
+        self.palavras.sort()
+        self.ordenados.sort()
+    
+    @staticmethod
+    def _texto(registro):
+        nome = normalizar_string(str(registro.get("nome", "") or ""))
+        telefone = re.sub(r"\D", "", str(registro.get("telefone", "") or ""))
+        return " ".join(f"{nome} {telefone}".split())
+    
+    @staticmethod
+    def _trigramas(texto):
+        return {texto[i:i + 3] for i in range(len(texto) - 2)}
+    
+    def _adicionar_texto(self, registro_id, texto, ordenado=False):
+        self.textos[registro_id] = texto
+        if ordenado:
+            bisect.insort(self.ordenados, (texto, registro_id))
+        else:
+            self.ordenados.append((texto, registro_id))
+        for trigrama in self._trigramas(f" {texto} "):
+            self.trigramas.setdefault(trigrama, set()).add(registro_id)
+        for palavra in set(texto.split()):
+            if ordenado:
+                bisect.insort(self.palavras, (palavra, registro_id))
+            else:
+                self.palavras.append((palavra, registro_id))
+    
+    def adicionar(self, registro):
+        self.remover(registro["id"])
+        self._adicionar_texto(registro["id"], self._texto(registro), ordenado=True)
+    
+    def remover(self, registro_id):
+        texto = self.textos.pop(registro_id, None)
+        if texto is None:
             return
+        posicao = bisect.bisect_left(self.ordenados, (texto, registro_id))
+        if posicao < len(self.ordenados) and self.ordenados[posicao] == (texto, registro_id):
+            del self.ordenados[posicao]
+        for trigrama in self._trigramas(f" {texto} "):
+            ids = self.trigramas.get(trigrama)
+            if ids is not None:
+                ids.discard(registro_id)
+                if not ids:
+                    del self.trigramas[trigrama]
+        for palavra in set(texto.split()):
+            posicao = bisect.bisect_left(self.palavras, (palavra, registro_id))
+            if posicao < len(self.palavras) and self.palavras[posicao] == (palavra, registro_id):
+                del self.palavras[posicao]
+    
+    def buscar(self, termo, limite=10):
+        """Retorna até `limite` ids, os que começam com o termo primeiro."""
+        termo = normalizar_string(str(termo or "")).strip()
+        if re.fullmatch(r"[\d\s()+-]+", termo):
+            termo = re.sub(r"\D", "", termo)
+        termo = " ".join(termo.split())
+        if not termo:
+            return []
         
-        df_vendas = pd.DataFrame(vendas)
+        inicio = bisect.bisect_left(self.ordenados, (termo,))
+        primeiros = [registro_id for texto, registro_id in self.ordenados[inicio:inicio + limite]
+                     if texto.startswith(termo)]
+        if len(primeiros) == limite:
+            return primeiros
         
-        if os.path.exists("vendas.xlsx"):
-            wb = load_workbook("vendas.xlsx")
-            if "Historico_Vendas" in wb.sheetnames:
-                df_existente = pd.read_excel("vendas.xlsx", sheet_name="Historico_Vendas")
-                df_atualizado = pd.concat([df_existente, df_vendas], ignore_index=True)
-                del wb["Historico_Vendas"]
-            else:
-                df_atualizado = df_vendas
-            ws = wb.create_sheet("Historico_Vendas")
+        if len(termo) < 3:
+            ids = set()
+            posicao = bisect.bisect_left(self.palavras, (termo,))
+            while posicao < len(self.palavras) and self.palavras[posicao][0].startswith(termo):
+                ids.add(self.palavras[posicao][1])
+                posicao += 1
         else:
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Historico_Vendas"
-            df_atualizado = df_vendas
+            listas = [self.trigramas.get(t, set()) for t in self._trigramas(termo)]
+            listas.sort(key=len)
+            ids = set(listas[0]).intersection(*listas[1:]) if listas[0] else set()
+            ids = {i for i in ids if termo in self.textos[i]}
+            if not ids:
+                return self._buscar_aproximado(listas, limite)
         
-        for r in dataframe_to_rows(df_atualizado, index=False, header=True):
-            ws.append(r)
+        def relevancia(registro_id):
+            texto = self.textos[registro_id]
+            if texto.startswith(termo):
+                return (0, texto)
+            if f" {termo}" in f" {texto}":
+                return (1, texto)
+            return (2, texto)
         
-        wb.save("vendas.xlsx")
-        registrar_log(f"Vendas de {data_arquivamento} arquivadas")
+        return heapq.nsmallest(limite, ids, key=relevancia)
     
-    except Exception as e:
-        registrar_log(f"Erro ao arquivar vendas: {str(e)}")
+    def _buscar_aproximado(self, listas, limite):
+        """Ordena por quantidade de trigramas em comum (exige ao menos metade)."""
+        contagem = {}
+        for ids in listas:
+            for registro_id in ids:
+                contagem[registro_id] = contagem.get(registro_id, 0) + 1
+        minimo = max(1, len(listas) // 2)
+        candidatos = [i for i, n in contagem.items() if n >= minimo]
+        candidatos.sort(key=lambda i: (-contagem[i], self.textos[i]))
+        return candidatos[:limite]
+
+class ListaIndexada(list):
+    """Lista de registros (dicts com "id" e "nome") com índices por id, por nome normalizado
+    e de busca (IndiceBusca).
+    
+    append, insert, extend e remove atualizam os índices na hora; qualquer
+    outra alteração da lista (atribuição de fatia, clear...) refaz os índices.
+    """
+    
+    def __init__(self, registros=()):
+        super().__init__(registros)
+        self.reindexar()
+    
+    def reindexar(self):
+        self.por_id = {}
+        self.por_nome = {}
+        self.maior_id = 0
+        self._ordenacoes = {}
+        for registro in self:
+            self._indexar(registro, busca=False)
+        self.busca = IndiceBusca(self)
+    
+    def _indexar(self, registro, busca=True):
+        self._ordenacoes = {}
+        self.por_id[registro["id"]] = registro
+        self.por_nome[normalizar_string(registro.get("nome", ""))] = registro
+        self.maior_id = max(self.maior_id, registro["id"])
+        if busca:
+            self.busca.adicionar(registro)
+    
+    def _desindexar(self, registro):
+        self._ordenacoes = {}
+        if self.por_id.get(registro["id"]) is registro:
+            del self.por_id[registro["id"]]
+            self.busca.remover(registro["id"])
+        nome = normalizar_string(registro.get("nome", ""))
+        if self.por_nome.get(nome) is registro:
+            del self.por_nome[nome]
+    
+    def proximo_id(self):
+        """Próximo id livre (ids removidos não são reaproveitados)."""
+        return self.maior_id + 1
+    
+    def ordenados(self, ordem, chave):
+        """(chaves, registros) ordenados por chave; guardado até a próxima alteração da lista."""
+        if ordem not in self._ordenacoes:
+            pares = sorted(((chave(r), r) for r in self), key=lambda par: par[0])
+            self._ordenacoes[ordem] = ([c for c, _ in pares], [r for _, r in pares])
+        return self._ordenacoes[ordem]
+    
+    def append(self, registro):
+        super().append(registro)
+        self._indexar(registro)
+    
+    def remove(self, registro):
+        for posicao, atual in enumerate(self):
+            if atual is registro:
+                super().__delitem__(posicao)
+                self._desindexar(registro)
+                return
+        super().remove(registro)
+    
+    def __setitem__(self, posicao, valor):
+        super().__setitem__(posicao, valor)
+        self.reindexar()
+    
+    def __delitem__(self, posicao):
+        super().__delitem__(posicao)
+        self.reindexar()
+    
+    def __iadd__(self, outros):
+        super().__iadd__(outros)
+        self.reindexar()
+        return self
+    
+    def extend(self, outros):
+        outros = list(outros)
+        super().extend(outros)
+        for registro in outros:
+            self._indexar(registro)
+    
+    def insert(self, posicao, registro):
+        super().insert(posicao, registro)
+        self._indexar(registro)
+    
+    def pop(self, posicao=-1):
+        registro = super().pop(posicao)
+        self._desindexar(registro)
+        return registro
+    
+    def clear(self):
+        super().clear()
+        self.reindexar()
+
+def buscar_por_id(registros, registro_id):
+    """Busca um registro pelo id (O(1) em ListaIndexada)."""
+    if isinstance(registros, ListaIndexada):
+        return registros.por_id.get(registro_id)
+    return next((r for r in registros if r.get("id") == registro_id), None)
+
+def pesquisar(registros, termo, limite=10):
+    """Registros cujo nome ou telefone combinam com o termo (até `limite`)."""
+    if not isinstance(registros, ListaIndexada):
+        registros = ListaIndexada(registros)
+    return [registros.por_id[i] for i in registros.busca.buscar(termo, limite)]
+
+TAMANHO_PAGINA = 50
+TAMANHO_MAXIMO_PAGINA = 500
+LIMITE_MAXIMO_BUSCA = 50
+
+def limite_da_requisicao(padrao, maximo):
+    """Parâmetro ?limite= da requisição, entre 1 e maximo (padrao se ausente ou inválido)."""
+    return max(1, min(request.args.get('limite', padrao, type=int), maximo))
 
-def limpar_vendas_diarias():
-    """Limpa aba Diario para começar novo dia."""
+def chave_ordenacao(registro, ordem):
+    """Chave de ordenação de um registro; o id desempata para o cursor ser único."""
+    if ordem == "nome":
+        return (normalizar_string(registro.get("nome", "")), registro["id"])
+    if ordem == "valor":
+        return (float(registro.get("valor") or 0), registro["id"])
+    return (registro["id"],)
+
+def codificar_cursor(chave):
+    """Codifica a chave do último registro de uma página para usar na URL."""
+    return base64.urlsafe_b64encode(json.dumps(list(chave)).encode("utf-8")).decode("ascii")
+
+def decodificar_cursor(cursor):
+    """Decodifica um cursor de página (None se inválido)."""
     try:
-        if os.path.exists("vendas.xlsx"):
-            wb = load_workbook("vendas.xlsx")
-            if "Diario" in wb.sheetnames:
-                del wb["Diario"]
-            ws = wb.create_sheet("Diario")
-            ws.append(["Cliente_ID", "Cliente_Nome", "Produto_Nome", "Tipo_Produto", 
-                      "Quantidade_Input", "Quantidade_Total", "Valor_Unitario", 
-                      "Valor_Total", "Forma_Pagamento", "Status_Pagamento", "Data"])
-            wb.save("vendas.xlsx")
-            registrar_log("Vendas diárias resetadas")
-    except Exception as e:
-        registrar_log(f"Erro ao limpar vendas: {str(e)}")
+        return tuple(json.loads(base64.urlsafe_b64decode(cursor.encode("ascii"))))
+    except (ValueError, TypeError):
+        return None
+
+def paginar_registros(registros, ordem="id", apos=None, limite=TAMANHO_PAGINA):
+    """Paginação por keyset: até `limite` registros depois do cursor `apos`.
+    
+    Retorna (pagina, cursor_da_proxima_pagina ou None).
+    """
+    if not isinstance(registros, ListaIndexada):
+        registros = ListaIndexada(registros)
+    chaves, ordenados = registros.ordenados(ordem, lambda r: chave_ordenacao(r, ordem))
+    
+    inicio = 0
+    chave_apos = decodificar_cursor(apos) if apos else None
+    if chave_apos is not None:
+        try:
+            inicio = bisect.bisect_right(chaves, chave_apos)
+        except TypeError:
+            inicio = 0
+    
+    fim = inicio + max(1, limite)
+    proximo = codificar_cursor(chaves[fim - 1]) if fim < len(ordenados) else None
+    return ordenados[inicio:fim], proximo
+
+def buscar_por_nome(registros, nome):
+    """Busca um registro pelo nome, ignorando acentos e maiúsculas (O(1) em ListaIndexada)."""
+    nome_normalizado = normalizar_string(nome)
+    if isinstance(registros, ListaIndexada):
+        return registros.por_nome.get(nome_normalizado)
+    return next((r for r in registros if normalizar_string(r.get("nome", "")) == nome_normalizado), None)
+
+def proximo_id(registros):
+    """Próximo id livre da lista."""
+    if isinstance(registros, ListaIndexada):
+        return registros.proximo_id()
+    return max((r["id"] for r in registros), default=0) + 1
+
+def _sincronizar_objeto(chave, arquivos, destino, carregar):
+    """Recarrega destino (lista ou dict global) no lugar se os arquivos mudaram."""
+    with _lock_repositorio:
+        dados = obter_dados(chave, arquivos, carregar)
+        if dados is not destino:
+            if isinstance(destino, dict):
+                destino.clear()
+                destino.update(dados)
+            else:
+                destino[:] = dados
+            _repositorio[chave]["dados"] = destino
+        return destino
+
+def obter_produtos():
+    """Produtos em memória (recarrega se estoque.xlsx mudou fora do app)."""
+    return _sincronizar_objeto("produtos", ["estoque.xlsx"], produtos, carregar_produtos)
+
+def obter_clientes():
+    """Clientes em memória (recarrega se vendas.xlsx mudou fora do app)."""
+    return _sincronizar_objeto("clientes", ["vendas.xlsx"], clientes, carregar_clientes)
+
+def obter_gastos():
+    """Gastos em memória (recarrega se gastos.xlsx mudou fora do app)."""
+    return _sincronizar_objeto("gastos", ["gastos.xlsx"], gastos, carregar_gastos)
+
+def obter_fechamentos_caixa():
+    """Fechamentos de caixa em memória."""
+    return obter_dados("fechamentos", ["vendas.xlsx"], carregar_fechamentos_caixa)
+
+def obter_vendas_diarias_df():
+    """Vendas do dia em memória como DataFrame (para agregações vetorizadas)."""
+    return obter_dados(f"vendas:diario_df:{obter_data_atual()}", ARQUIVOS_BANCO, carregar_vendas_diarias_df)
 
 # ---------------------------------------------------------------------
 # MÓDULO: PRODUTOS (estoque.xlsx)
 
+def _descartar_ids_invalidos(df, aba):
+    """Remove da aba as linhas com ID vazio ou não inteiro, registrando-as no log."""
+    ids = pd.to_numeric(df["ID"], errors="coerce")
+    validas = ids.notna() & (ids == ids.round())
+    if not validas.all():
+        linhas = [str(indice + 2) for indice in df.index[~validas][:20]]
+        registrar_log(f"Aba {aba}: {int((~validas).sum())} linhas com ID inválido ignoradas "
+                      f"(linhas {', '.join(linhas)})")
+    df = df[validas].copy()
+    df["ID"] = ids[validas].astype("int64")
+    return df
+
 def carregar_produtos():
     """Carrega produtos do arquivo estoque.xlsx."""
     if not os.path.exists("estoque.xlsx"):
         return []
     try:
-        df = pd.read_excel("estoque.xlsx")
-        if df.empty:
+        df = ler_aba("estoque.xlsx", "Produtos")
+        if df is None or df.empty:
             return []
-        produtos = df.to_dict('records')
-        return produtos
+        df = _descartar_ids_invalidos(df, "Produtos")
+        posicoes = df.reindex(columns=["Corredor", "Prateleira"])
+        posicao_valida = posicoes.notna().all(axis=1) & (posicoes > 0).all(axis=1)
+        df = pd.DataFrame({
+            "id": df["ID"].astype("int64"),
+            "nome": df["Nome"].astype(str),
+            "tipo": df["Tipo"].astype(str),
+            "valor": df["Valor"].astype(float),
+            "controlar_estoque": df["Controlar_Estoque"].fillna(False).astype(bool),
+            "quantidade": df["Quantidade"].fillna(0.0).astype(float),
+            **{coluna.lower(): posicoes[coluna].where(posicao_valida).astype("Int64").astype(object)
+                                               .where(posicao_valida, None)
+               for coluna in ("Corredor", "Prateleira")}
+        })
+        return df.to_dict('records')
     except Exception as e:
+        # Não devolve lista vazia: o próximo salvar_produtos apagaria o catálogo.
         registrar_log(f"Erro ao carregar produtos: {str(e)}")
-        return []
+        raise
 
 def salvar_produtos(produtos):
     """Salva produtos no arquivo estoque.xlsx."""
     try:
         if not produtos:
-            df = pd.DataFrame(columns=["ID", "Nome", "Tipo", "Valor", "Controlar_Estoque", "Quantidade"])
+            df = pd.DataFrame(columns=["ID", "Nome", "Tipo", "Valor", "Controlar_Estoque", "Quantidade",
+                                       "Corredor", "Prateleira"])
         else:
             df = pd.DataFrame(produtos)
-            df = df[["id", "nome", "tipo", "valor", "controlar_estoque", "quantidade"]].rename(
+            df = df.reindex(columns=["id", "nome", "tipo", "valor", "controlar_estoque", "quantidade",
+                                     "corredor", "prateleira"]).rename(
                 columns={"id": "ID", "nome": "Nome", "tipo": "Tipo", "valor": "Valor", 
-                        "controlar_estoque": "Controlar_Estoque", "quantidade": "Quantidade"}
+                        "controlar_estoque": "Controlar_Estoque", "quantidade": "Quantidade",
+                        "corredor": "Corredor", "prateleira": "Prateleira"}
             )
+            df[["Corredor", "Prateleira"]] = df[["Corredor", "Prateleira"]].astype(object).where(
+                df[["Corredor", "Prateleira"]].notna(), None)
         
-        if os.path.exists("estoque.xlsx"):
-            wb = load_workbook("estoque.xlsx")
-            if "Produtos" in wb.sheetnames:
-                del wb["Produtos"]
-            ws = wb.create_sheet("Produtos")
-        else:
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Produtos"
+        with bloqueio_arquivo("estoque.xlsx"):
+            if os.path.exists("estoque.xlsx"):
+                wb = abrir_workbook("estoque.xlsx")
+                if "Produtos" in wb.sheetnames:
+                    del wb["Produtos"]
+                ws = wb.create_sheet("Produtos")
+            else:
+                wb = Workbook()
+                ws = wb.active
+                ws.title = "Produtos"
         
-        for r in dataframe_to_rows(df, index=False, header=True):
-            ws.append(r)
+            for r in dataframe_to_rows(df, index=False, header=True):
+                ws.append(r)
         
-        wb.save("estoque.xlsx")
+            salvar_workbook(wb, "estoque.xlsx", preservar=("produtos:matriz",))
+            registrar_escrita("produtos", ["estoque.xlsx"], produtos)
     except Exception as e:
         registrar_log(f"Erro ao salvar produtos: {str(e)}")
         raise
 
+TIPOS_PRODUTO = ["unitario", "quilo", "esteira"]
+
 def cadastrar_produto(produtos, nome, tipo, valor, controlar_estoque, quantidade=0):
     """Cadastra novo produto."""
     if not nome or nome.strip() == "":
         return "Erro: Nome vazio!"
     
-    tipos_validos = ["unitario", "quilo", "esteira"]
-    if tipo not in tipos_validos:
+    if tipo not in TIPOS_PRODUTO:
         return "Erro: Tipo inválido!"
     
     valor_validado = validar_numero_positivo(valor)
@@ -179,12 +1028,10 @@ def cadastrar_produto(produtos, nome, tipo, valor, controlar_estoque, quantidade
     else:
         quantidade_validada = 0
     
-    nome_normalizado = normalizar_string(nome)
-    for produto in produtos:
-        if normalizar_string(produto["nome"]) == nome_normalizado:
-            return f"Erro: Produto '{nome}' já existe!"
+    if buscar_por_nome(produtos, nome):
+        return f"Erro: Produto '{nome}' já existe!"
     
-    id = len(produtos) + 1
+    id = proximo_id(produtos)
     produto = {
         "id": id,
         "nome": nome.strip(),
@@ -193,26 +1040,228 @@ def cadastrar_produto(produtos, nome, tipo, valor, controlar_estoque, quantidade
         "controlar_estoque": controlar_estoque,
         "quantidade": quantidade_validada
     }
+    matriz = obter_matriz()
+    produto["corredor"], produto["prateleira"] = matriz.alocar(id)
     produtos.append(produto)
+    try:
+        salvar_produtos(produtos)
+    except Exception:
+        produtos.remove(produto)
+        matriz.liberar(id)
+        raise
+    registrar_escrita("produtos:matriz", ["estoque.xlsx"], matriz)
     registrar_log(f"Produto cadastrado: {nome}")
-    return f"Produto '{nome}' cadastrado!"
+    return f"Produto '{nome}' cadastrado! Posição: corredor {produto['corredor']}, prateleira {produto['prateleira']}"
 
 def remover_produto(produtos, produto_id):
     """Remove produto."""
-    produto = next((p for p in produtos if p["id"] == produto_id), None)
+    produto = buscar_por_id(produtos, produto_id)
     if not produto:
         return "Erro: Produto não encontrado!"
+    matriz = obter_matriz()
     produtos.remove(produto)
     salvar_produtos(produtos)
+    matriz.liberar(produto_id)
+    registrar_escrita("produtos:matriz", ["estoque.xlsx"], matriz)
     registrar_log(f"Produto removido: {produto['nome']}")
     return "Produto removido!"
 
-def atualizar_estoque(produtos, produto_id, quantidade_vendida):
-    """Atualiza estoque (só se controlar)."""
-    produto = next((p for p in produtos if p["id"] == produto_id), None)
-    if produto and produto["controlar_estoque"]:
-        produto["quantidade"] -= quantidade_vendida
+def baixar_estoque(produtos, baixas):
+    """Aplica várias baixas {produto_id: quantidade} em memória.
+    
+    Não salva o arquivo; retorna as quantidades anteriores para permitir desfazer.
+    """
+    anteriores = {}
+    for produto_id, quantidade in baixas.items():
+        produto = buscar_por_id(produtos, produto_id)
+        if produto and produto["controlar_estoque"]:
+            anteriores[produto_id] = produto["quantidade"]
+            produto["quantidade"] -= quantidade
+    return anteriores
+
+def restaurar_estoque(produtos, anteriores):
+    """Desfaz baixas feitas por baixar_estoque."""
+    for produto_id, quantidade in anteriores.items():
+        produto = buscar_por_id(produtos, produto_id)
+        if produto:
+            produto["quantidade"] = quantidade
+
+# ---------------------------------------------------------------------
+# MÓDULO: MATRIZ DE ESTOQUE (colunas Corredor e Prateleira do estoque.xlsx)
+#
+# Cada produto ocupa uma posição corredor × prateleira, gravada junto com o
+# produto. Em memória a grade é um array de IDs (0 = vazia), indexado por
+# (corredor - 1) * prateleiras + (prateleira - 1), mais um dict do ID para a
+# posição: as duas consultas são O(1). As posições livres ficam num heap,
+# então a próxima livre é a de menor corredor/prateleira, em O(log n). A
+# grade ganha corredores quando lota. Reorganizar refaz tudo numa passada
+# e regrava o estoque.xlsx uma única vez. Posições gravadas além de
+# LIMITE_CORREDORES_MATRIZ (ou do necessário para todos os produtos) contam
+# como sem posição, para um Corredor digitado errado não inflar a grade.
+
+CORREDORES_MATRIZ = 10
+PRATELEIRAS_MATRIZ = 3
+LIMITE_CORREDORES_MATRIZ = 1000
+CRITERIOS_MATRIZ = ("id", "nome", "vendas")
+
+class MatrizEstoque:
+    """Grade corredor × prateleira de produtos."""
+    
+    def __init__(self, corredores=CORREDORES_MATRIZ, prateleiras=PRATELEIRAS_MATRIZ,
+                 limite_corredores=LIMITE_CORREDORES_MATRIZ):
+        self.prateleiras = prateleiras
+        self.limite_corredores = limite_corredores
+        self.grade = array("q", bytes(8 * corredores * prateleiras))
+        self.posicoes = {}
+        self.livres = list(range(len(self.grade)))
+        self.sem_posicao = []
+    
+    @property
+    def corredores(self):
+        return len(self.grade) // self.prateleiras
+    
+    def _indice(self, corredor, prateleira):
+        return (corredor - 1) * self.prateleiras + (prateleira - 1)
+    
+    def _crescer(self, corredores):
+        """Acrescenta corredores vazios ao fim da grade."""
+        inicio = len(self.grade)
+        self.grade.frombytes(bytes(8 * corredores * self.prateleiras))
+        for indice in range(inicio, len(self.grade)):
+            heapq.heappush(self.livres, indice)
+    
+    def posicao(self, produto_id):
+        """(corredor, prateleira) do produto, ou None."""
+        indice = self.posicoes.get(produto_id)
+        if indice is None:
+            return None
+        return indice // self.prateleiras + 1, indice % self.prateleiras + 1
+    
+    def produto_em(self, corredor, prateleira):
+        """ID do produto na posição (0 se vazia)."""
+        return self.grade[self._indice(corredor, prateleira)]
+    
+    def ocupar(self, produto_id, corredor, prateleira):
+        """Coloca o produto numa posição específica; False se ela for inválida ou ocupada."""
+        if not (1 <= prateleira <= self.prateleiras and 1 <= corredor <= self.limite_corredores):
+            return False
+        if corredor > self.corredores:
+            self._crescer(corredor - self.corredores)
+        indice = self._indice(corredor, prateleira)
+        if self.grade[indice]:
+            return False
+        self.liberar(produto_id)
+        self.grade[indice] = produto_id
+        self.posicoes[produto_id] = indice
+        return True
+    
+    def alocar(self, produto_id):
+        """Coloca o produto na próxima posição livre; retorna (corredor, prateleira)."""
+        if produto_id in self.posicoes:
+            return self.posicao(produto_id)
+        # Posições ocupadas por ocupar() continuam no heap e são descartadas aqui.
+        while self.livres and self.grade[self.livres[0]]:
+            heapq.heappop(self.livres)
+        if not self.livres:
+            self._crescer(1)
+        indice = heapq.heappop(self.livres)
+        self.grade[indice] = produto_id
+        self.posicoes[produto_id] = indice
+        return self.posicao(produto_id)
+    
+    def liberar(self, produto_id):
+        """Esvazia a posição do produto (se tiver uma)."""
+        indice = self.posicoes.pop(produto_id, None)
+        if indice is not None:
+            self.grade[indice] = 0
+            heapq.heappush(self.livres, indice)
+        if produto_id in self.sem_posicao:
+            self.sem_posicao.remove(produto_id)
+    
+    def redistribuir(self, produto_ids):
+        """Ocupa as posições em sequência, na ordem dos IDs informados."""
+        corredores = max(CORREDORES_MATRIZ, -(-len(produto_ids) // self.prateleiras))
+        self.grade = array("q", produto_ids)
+        self.grade.frombytes(bytes(8 * (corredores * self.prateleiras - len(produto_ids))))
+        self.posicoes = {produto_id: indice for indice, produto_id in enumerate(produto_ids)}
+        self.livres = list(range(len(produto_ids), len(self.grade)))
+        self.sem_posicao = []
+
+def montar_matriz(produtos):
+    """Grade a partir das posições gravadas nos produtos."""
+    matriz = MatrizEstoque(limite_corredores=max(LIMITE_CORREDORES_MATRIZ, -(-len(produtos) // PRATELEIRAS_MATRIZ)))
+    for produto in produtos:
+        corredor, prateleira = produto.get("corredor"), produto.get("prateleira")
+        if not (corredor and prateleira and matriz.ocupar(produto["id"], corredor, prateleira)):
+            matriz.sem_posicao.append(produto["id"])
+    return matriz
+
+def obter_matriz():
+    """Grade em memória (refeita se o estoque.xlsx mudou fora do app)."""
+    return obter_dados("produtos:matriz", ["estoque.xlsx"], lambda: montar_matriz(obter_produtos()))
+
+def _aplicar_posicoes(produtos, matriz):
+    """Copia as posições da grade para os produtos; retorna as anteriores."""
+    anteriores = {}
+    for produto in produtos:
+        anteriores[produto["id"]] = (produto.get("corredor"), produto.get("prateleira"))
+        produto["corredor"], produto["prateleira"] = matriz.posicao(produto["id"]) or (None, None)
+    return anteriores
+
+def reorganizar_matriz(produtos, criterio="id"):
+    """Reposiciona produtos na grade e regrava o estoque.xlsx uma vez.
+    
+    Com criterio None só os produtos sem posição são alocados; com "id",
+    "nome" ou "vendas" (mais vendidos em 90 dias primeiro) a grade inteira é
+    refeita nessa ordem.
+    """
+    matriz = obter_matriz()
+    if criterio is None:
+        pendentes = list(matriz.sem_posicao)
+        for produto_id in pendentes:
+            matriz.alocar(produto_id)
+        matriz.sem_posicao = []
+        mensagem = f"{len(pendentes)} produtos posicionados!"
+    else:
+        if criterio == "vendas":
+            ordem = [d["id"] for d in desempenho_produtos(produtos, 90)]
+        elif criterio == "nome":
+            ordem = [p["id"] for p in sorted(produtos, key=lambda p: normalizar_string(p["nome"]))]
+        else:
+            ordem = sorted(p["id"] for p in produtos)
+        matriz.redistribuir(ordem)
+        mensagem = f"Matriz reorganizada por {criterio}!"
+    
+    anteriores = _aplicar_posicoes(produtos, matriz)
+    try:
         salvar_produtos(produtos)
+    except Exception:
+        for produto in produtos:
+            produto["corredor"], produto["prateleira"] = anteriores[produto["id"]]
+        registrar_escrita("produtos:matriz", ["estoque.xlsx"])
+        raise
+    registrar_escrita("produtos:matriz", ["estoque.xlsx"], matriz)
+    registrar_log(mensagem)
+    return mensagem
+
+def dados_matriz(produtos, matriz):
+    """Corredores e prateleiras no formato do matriz.html.
+    
+    Mostra os CORREDORES_MATRIZ configurados e, além deles, só os ocupados.
+    """
+    ocupados = {indice // matriz.prateleiras + 1 for indice in matriz.posicoes.values()}
+    corredores = []
+    for corredor in sorted(ocupados.union(range(1, min(CORREDORES_MATRIZ, matriz.corredores) + 1))):
+        prateleiras = []
+        for prateleira in range(1, matriz.prateleiras + 1):
+            produto = buscar_por_id(produtos, matriz.produto_em(corredor, prateleira))
+            prateleiras.append({
+                "numero": prateleira,
+                "produto": produto["nome"] if produto else "Vazio",
+                "quantidade": produto["quantidade"] if produto and produto["controlar_estoque"] else None
+            })
+        corredores.append({"numero": corredor, "prateleiras": prateleiras})
+    return corredores
 
 # ---------------------------------------------------------------------
 # MÓDULO: CLIENTES (vendas.xlsx, aba Clientes) - CORRIGIDO
@@ -223,33 +1272,30 @@ def carregar_clientes():
         registrar_log("Arquivo vendas.xlsx não encontrado. Criando novo.")
         return []
     try:
-        df = pd.read_excel("vendas.xlsx", sheet_name="Clientes")
+        df = ler_aba("vendas.xlsx", "Clientes")
+        if df is None:
+            registrar_log("Aba Clientes não existe. Iniciando com lista vazia.")
+            return []
         if df.empty:
             return []
         
         colunas_esperadas = ["ID", "Nome", "Telefone", "Observacoes"]
         if not all(col in df.columns for col in colunas_esperadas):
-            registrar_log(f"Erro: Colunas inválidas em Clientes. Esperado: {colunas_esperadas}")
-            return []
+            raise ValueError(f"Colunas inválidas em Clientes. Esperado: {colunas_esperadas}")
+        df = _descartar_ids_invalidos(df, "Clientes")
         
-        clientes = []
-        for _, row in df.iterrows():
-            cliente = {
-                "id": int(row["ID"]),
-                "nome": str(row["Nome"]),
-                "telefone": str(row["Telefone"]) if pd.notna(row["Telefone"]) else "",
-                "observacoes": str(row["Observacoes"]) if pd.notna(row["Observacoes"]) else ""
-            }
-            clientes.append(cliente)
-        return clientes
-    
-    except ValueError:
-        registrar_log("Aba Clientes não existe. Iniciando com lista vazia.")
-        return []
+        df = pd.DataFrame({
+            "id": df["ID"].astype("int64"),
+            "nome": df["Nome"].astype(str),
+            "telefone": df["Telefone"].where(df["Telefone"].notna(), "").astype(str),
+            "observacoes": df["Observacoes"].where(df["Observacoes"].notna(), "").astype(str)
+        })
+        return df.to_dict('records')
     
     except Exception as e:
+        # Não devolve lista vazia: o próximo salvar_clientes apagaria os clientes.
         registrar_log(f"Erro ao carregar clientes: {str(e)}")
-        return []
+        raise
 
 def salvar_clientes(clientes):
     """Salva clientes no arquivo vendas.xlsx."""
@@ -266,20 +1312,22 @@ def salvar_clientes(clientes):
                 columns={"id": "ID", "nome": "Nome", "telefone": "Telefone", "observacoes": "Observacoes"}
             )
         
-        if os.path.exists("vendas.xlsx"):
-            wb = load_workbook("vendas.xlsx")
-            if "Clientes" in wb.sheetnames:
-                del wb["Clientes"]
-            ws = wb.create_sheet("Clientes")
-        else:
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Clientes"
+        with bloqueio_arquivo("vendas.xlsx"):
+            if os.path.exists("vendas.xlsx"):
+                wb = abrir_workbook("vendas.xlsx")
+                if "Clientes" in wb.sheetnames:
+                    del wb["Clientes"]
+                ws = wb.create_sheet("Clientes")
+            else:
+                wb = Workbook()
+                ws = wb.active
+                ws.title = "Clientes"
         
-        for r in dataframe_to_rows(df, index=False, header=True):
-            ws.append(r)
+            for r in dataframe_to_rows(df, index=False, header=True):
+                ws.append(r)
         
-        wb.save("vendas.xlsx")
+            salvar_workbook(wb, "vendas.xlsx", preservar=("fechamentos",))
+            registrar_escrita("clientes", ["vendas.xlsx"], clientes)
         registrar_log("Clientes salvos")
     
     except Exception as e:
@@ -292,12 +1340,10 @@ def cadastrar_cliente(clientes, nome, telefone, observacoes):
         if not nome or nome.strip() == "":
             return "Erro: Nome vazio!"
         
-        nome_normalizado = normalizar_string(nome)
-        for cliente in clientes:
-            if normalizar_string(cliente.get("nome", "")) == nome_normalizado:
-                return f"Erro: Cliente '{nome}' já existe!"
+        if buscar_por_nome(clientes, nome):
+            return f"Erro: Cliente '{nome}' já existe!"
         
-        id = len(clientes) + 1
+        id = proximo_id(clientes)
         cliente = {
             "id": id,
             "nome": nome.strip(),
@@ -317,7 +1363,7 @@ def cadastrar_cliente(clientes, nome, telefone, observacoes):
 def remover_cliente(clientes, cliente_id):
     """Remove cliente."""
     try:
-        cliente = next((c for c in clientes if c.get("id") == cliente_id), None)
+        cliente = buscar_por_id(clientes, cliente_id)
         if not cliente:
             return "Erro: Cliente não encontrado!"
         
@@ -331,99 +1377,676 @@ def remover_cliente(clientes, cliente_id):
         return f"Erro: {str(e)}"
 
 # ---------------------------------------------------------------------
-# MÓDULO: VENDAS (vendas.xlsx, aba Diario)
+# MÓDULO: VENDAS (vendas.db, tabelas diario e historico_AAAA_MM)
+#
+# As vendas ficam num banco SQLite em modo WAL: registrar uma venda é um
+# INSERT, sem reescrever planilha. O histórico é particionado por mês (uma
+# tabela historico_AAAA_MM por mês), então o arquivamento só toca a partição
+# do mês e consultas por data ou mês leem só as partições necessárias.
+# As antigas abas Diario e Historico_Vendas do vendas.xlsx são migradas para
+# o banco e apagadas da planilha; para tirar as vendas em planilha, use a
+# exportação (/exportar/vendas), que gera um arquivo à parte.
+
+ARQUIVOS_BANCO = ["vendas.db", "vendas.db-wal"]
+
+COLUNAS_VENDA = ["Cliente_ID", "Cliente_Nome", "Produto_Nome", "Tipo_Produto",
+                 "Quantidade_Input", "Quantidade_Total", "Valor_Unitario",
+                 "Valor_Total", "Forma_Pagamento", "Status_Pagamento", "Data"]
+
+ESQUEMA_VENDA = """
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Cliente_ID INTEGER, Cliente_Nome TEXT, Produto_Nome TEXT, Tipo_Produto TEXT,
+    Quantidade_Input REAL, Quantidade_Total REAL, Valor_Unitario REAL,
+    Valor_Total REAL, Forma_Pagamento TEXT, Status_Pagamento TEXT, Data TEXT
+"""
+
+_conexoes = threading.local()
+
+def conectar_banco():
+    """Retorna a conexão com vendas.db da thread atual (cria tabelas na primeira vez).
+    
+    A criação das tabelas e a migração inicial rodam sob a trava de vendas.db,
+    para que só um worker migre as planilhas.
+    """
+    conexao = getattr(_conexoes, "conexao", None)
+    if conexao is not None:
+        return conexao
+    
+    with bloqueio_arquivo("vendas.db"):
+        banco_novo = not os.path.exists("vendas.db")
+        conexao = sqlite3.connect("vendas.db", timeout=30)
+        conexao.row_factory = sqlite3.Row
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute("PRAGMA synchronous=NORMAL")
+    
+        conexao.create_function("semana_iso", 1, semana_iso, deterministic=True)
+        resumos_novos = conexao.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ('resumo_diario', 'resumo_periodo')"
+        ).fetchone()[0] < 2
+        with conexao:
+            conexao.execute(f"CREATE TABLE IF NOT EXISTS diario ({ESQUEMA_VENDA})")
+            conexao.execute("CREATE INDEX IF NOT EXISTS idx_diario_data ON diario (Data)")
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS resumo_diario (
+                    Data TEXT PRIMARY KEY, Total_Vendas REAL, Total_Pago REAL,
+                    Total_Pendente REAL, Linhas INTEGER)
+            """)
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS resumo_diario_pagamento (
+                    Data TEXT, Forma_Pagamento TEXT, Total REAL, Linhas INTEGER,
+                    PRIMARY KEY (Data, Forma_Pagamento))
+            """)
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS resumo_periodo (
+                    Periodo TEXT, Dimensao TEXT, Chave_Periodo TEXT, Chave TEXT, Nome TEXT,
+                    Quantidade REAL, Valor_Total REAL, Linhas INTEGER,
+                    PRIMARY KEY (Periodo, Dimensao, Chave_Periodo, Chave))
+            """)
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS reservas_estoque (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, Carrinho TEXT,
+                    Produto_ID INTEGER, Quantidade REAL, Expira REAL)
+            """)
+            conexao.execute("CREATE INDEX IF NOT EXISTS idx_reservas_produto ON reservas_estoque (Produto_ID, Expira)")
+            conexao.execute("CREATE INDEX IF NOT EXISTS idx_reservas_carrinho ON reservas_estoque (Carrinho)")
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS carrinhos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, Carrinho TEXT,
+                    Produto_ID INTEGER, Quantidade_Input REAL, Atualizado REAL)
+            """)
+            conexao.execute("CREATE INDEX IF NOT EXISTS idx_carrinhos_carrinho ON carrinhos (Carrinho)")
+            conexao.execute("CREATE INDEX IF NOT EXISTS idx_carrinhos_atualizado ON carrinhos (Atualizado)")
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS chaves_sincronizacao (
+                    Chave TEXT PRIMARY KEY, Terminal TEXT, Recebido REAL, Resultado TEXT)
+            """)
+    
+        migrado = False
+        if banco_novo:
+            try:
+                migrado = migrar_vendas_planilha(conexao)
+            except Exception:
+                # Banco recém-criado e vazio: apaga para a migração rodar de novo na próxima conexão.
+                conexao.close()
+                for sufixo in ("", "-wal", "-shm"):
+                    if os.path.exists("vendas.db" + sufixo):
+                        os.remove("vendas.db" + sufixo)
+                raise
+        _conexoes.conexao = conexao
+        if resumos_novos and not banco_novo:
+            reconstruir_resumos(conexao)
+    
+    # Só depois de migrar com sucesso, e fora da trava do vendas.db (a limpeza pega a do vendas.xlsx).
+    if migrado:
+        remover_abas_vendas_antigas()
+    return conexao
+
+def mes_da_data(data):
+    """Retorna o mês AAAA-MM de uma data (ou '0000-00' se a data for inválida)."""
+    mes = str(data or "")[:7]
+    return mes if re.fullmatch(r"\d{4}-\d{2}", mes) else "0000-00"
+
+def tabela_historico(mes):
+    """Nome da partição do histórico para o mês AAAA-MM."""
+    if not re.fullmatch(r"\d{4}-\d{2}", mes):
+        raise ValueError(f"Mês inválido: {mes}")
+    return f"historico_{mes.replace('-', '_')}"
+
+def garantir_particao_historico(conexao, mes):
+    """Cria (se preciso) a partição do mês e retorna o nome da tabela."""
+    tabela = tabela_historico(mes)
+    conexao.execute(f"CREATE TABLE IF NOT EXISTS {tabela} ({ESQUEMA_VENDA})")
+    conexao.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_data ON {tabela} (Data)")
+    return tabela
+
+def listar_meses_historico(conexao=None):
+    """Lista os meses (AAAA-MM) que têm partição no histórico, em ordem."""
+    conexao = conexao or conectar_banco()
+    nomes = conexao.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'historico_[0-9][0-9][0-9][0-9]_[0-9][0-9]'"
+    ).fetchall()
+    return sorted(nome[0][len("historico_"):].replace("_", "-") for nome in nomes)
 
-def carregar_vendas_diarias():
-    """Carrega vendas diárias (apenas do dia atual)."""
+def _inserir_historico(conexao, vendas):
+    """Insere vendas no histórico, cada uma na partição do seu mês."""
+    por_mes = {}
+    for venda in vendas:
+        por_mes.setdefault(mes_da_data(venda.get("Data")), []).append(venda)
+    for mes, vendas_mes in por_mes.items():
+        _inserir_vendas(conexao, garantir_particao_historico(conexao, mes), vendas_mes)
+
+def tabelas_vendas(conexao):
+    """Todas as tabelas com linhas de venda: diario e as partições do histórico."""
+    return ["diario"] + [tabela_historico(mes) for mes in listar_meses_historico(conexao)]
+
+def _registrar_vendas(conexao, vendas):
+    """Insere vendas novas no diario e atualiza os resumos (dentro de uma transação)."""
+    _inserir_vendas(conexao, "diario", vendas)
+    atualizar_resumos(conexao, vendas)
+
+def _valores_venda(venda):
+    """Converte uma venda (dict) na tupla de valores de COLUNAS_VENDA."""
+    valores = []
+    for coluna in COLUNAS_VENDA:
+        valor = venda.get(coluna)
+        if hasattr(valor, "item"):
+            valor = valor.item()
+        if isinstance(valor, float) and pd.isna(valor):
+            valor = None
+        if coluna == "Data" and valor is not None:
+            valor = str(valor)[:10]
+        valores.append(valor)
+    return tuple(valores)
+
+def _inserir_vendas(conexao, tabela, vendas):
+    """Insere várias vendas numa tabela (sem commit; use dentro de uma transação)."""
+    linhas = [_valores_venda(v) for v in vendas]
+    conexao.executemany(
+        f"INSERT INTO {tabela} ({', '.join(COLUNAS_VENDA)}) "
+        f"VALUES ({', '.join('?' for _ in COLUNAS_VENDA)})",
+        linhas
+    )
+    incrementar("sgv_banco_linhas_gravadas_total", len(linhas), tabela=tabela)
+
+def _consultar_vendas(sql, parametros=()):
+    """Executa uma consulta no banco de vendas e devolve lista de dicts."""
+    cursor = conectar_banco().execute(sql, parametros)
+    vendas = [dict(linha) for linha in cursor.fetchall()]
+    incrementar("sgv_banco_linhas_lidas_total", len(vendas))
+    return vendas
+
+ABAS_VENDAS_ANTIGAS = ["Diario", "Historico_Vendas"]
+
+def migrar_vendas_planilha(conexao):
+    """Importa as abas Diario e Historico_Vendas do vendas.xlsx para um banco novo.
+    
+    Tudo numa única transação; retorna True se havia abas antigas a migrar.
+    """
     if not os.path.exists("vendas.xlsx"):
-        return []
+        return False
+    abas = ler_planilha("vendas.xlsx", ABAS_VENDAS_ANTIGAS)
+    with conexao:
+        for aba, df in abas.items():
+            if df.empty:
+                continue
+            for coluna in ("Valor_Total", "Quantidade_Total"):  # células vazias viram 0 nos resumos
+                if coluna in df.columns:
+                    df[coluna] = pd.to_numeric(df[coluna], errors="coerce").fillna(0)
+            if aba == "Diario":
+                _registrar_vendas(conexao, df.to_dict('records'))
+            else:
+                _inserir_historico(conexao, df.to_dict('records'))
+                atualizar_resumos(conexao, df.to_dict('records'))
+    for aba, df in abas.items():
+        registrar_log(f"Aba {aba} migrada para vendas.db ({len(df)} linhas)")
+    return bool(abas)
+
+def remover_abas_vendas_antigas():
+    """Apaga do vendas.xlsx as abas de vendas logo depois de migradas para o banco.
+    
+    Sem elas, salvar clientes ou fechamentos não regrava o histórico inteiro.
+    Se falhar, as abas ficam no arquivo (o banco já tem as vendas).
+    """
     try:
-        df = pd.read_excel("vendas.xlsx", sheet_name="Diario")
-        if df.empty:
-            return []
-        data_hoje = obter_data_atual()
-        vendas = df.to_dict('records')
-        vendas_hoje = [v for v in vendas if str(v.get("Data", "")) == data_hoje]
-        return vendas_hoje
-    except:
-        return []
+        with bloqueio_arquivo("vendas.xlsx"):
+            wb = abrir_workbook("vendas.xlsx")
+            antigas = [aba for aba in ABAS_VENDAS_ANTIGAS if aba in wb.sheetnames]
+            if not antigas:
+                return
+            for aba in antigas:
+                del wb[aba]
+            if not wb.sheetnames:
+                wb.create_sheet("Clientes").append(["ID", "Nome", "Telefone", "Observacoes"])
+            salvar_workbook(wb, "vendas.xlsx", preservar=("clientes", "fechamentos"))
+        registrar_log(f"Abas {', '.join(antigas)} removidas do vendas.xlsx (vendas no vendas.db)")
+    except Exception as e:
+        registrar_log(f"Erro ao remover abas antigas do vendas.xlsx: {str(e)}")
 
-def carregar_historico_vendas():
-    """Carrega histórico completo de vendas."""
-    if not os.path.exists("vendas.xlsx"):
-        return []
+def carregar_vendas_diarias_df():
+    """Carrega as vendas do dia atual num DataFrame."""
     try:
-        df = pd.read_excel("vendas.xlsx", sheet_name="Historico_Vendas")
-        return df.to_dict('records') if not df.empty else []
-    except:
-        return []
+        df = pd.read_sql_query(
+            f"SELECT {', '.join(COLUNAS_VENDA)} FROM diario WHERE Data = ? ORDER BY id",
+            conectar_banco(), params=(obter_data_atual(),)
+        )
+        incrementar("sgv_banco_linhas_lidas_total", len(df))
+        return df
+    except Exception as e:
+        registrar_log(f"Erro ao carregar vendas diárias: {str(e)}")
+        return pd.DataFrame(columns=COLUNAS_VENDA)
+
+def iterar_vendas_diarias(tamanho_lote=500):
+    """Percorre as vendas do dia em lotes, sem carregar todas em memória."""
+    cursor = conectar_banco().execute(
+        f"SELECT {', '.join(COLUNAS_VENDA)} FROM diario WHERE Data = ? ORDER BY id",
+        (obter_data_atual(),)
+    )
+    while True:
+        linhas = cursor.fetchmany(tamanho_lote)
+        if not linhas:
+            break
+        for linha in linhas:
+            yield dict(linha)
+
+def iterar_vendas(data_inicio=None, data_fim=None, cliente_id=None, tamanho_lote=1000):
+    """Percorre histórico + diário filtrando por período e cliente, em lotes.
+    
+    Usa uma conexão própria, só de leitura: no modo WAL ela não bloqueia as
+    gravações dos pedidos enquanto a exportação está em andamento.
+    """
+    conectar_banco()  # cria (e migra) o vendas.db numa instalação nova
+    conexao = sqlite3.connect("file:vendas.db?mode=ro", uri=True, timeout=30)
+    try:
+        tabelas = [tabela_historico(mes) for mes in listar_meses_historico(conexao)
+                   if not (data_inicio and mes < data_inicio[:7]) and not (data_fim and mes > data_fim[:7])]
+        filtro = "WHERE Data >= ? AND Data <= ?"
+        parametros = [data_inicio or "", data_fim or "9999-99-99"]
+        if cliente_id is not None:
+            filtro += " AND Cliente_ID = ?"
+            parametros.append(cliente_id)
+        for tabela in tabelas + ["diario"]:
+            cursor = conexao.execute(
+                f"SELECT {', '.join(COLUNAS_VENDA)} FROM {tabela} {filtro} ORDER BY id", parametros
+            )
+            while True:
+                linhas = cursor.fetchmany(tamanho_lote)
+                if not linhas:
+                    break
+                yield from linhas
+    finally:
+        conexao.close()
+
+def registrar_pedido(produtos, vendas, baixas, carrinho_id=None, chaves=None):
+    """Grava as linhas de um pedido e as baixas de estoque de forma atômica.
+    
+    As vendas entram numa única transação do vendas.db (que também esvazia o
+    carrinho, apaga suas reservas e grava as chaves de sincronização) e o
+    estoque.xlsx é regravado uma só vez (troca atômica). Vendas de dias
+    anteriores vão direto para o histórico. Se qualquer etapa falhar, a
+    transação é desfeita e o estoque volta ao estado anterior, em memória e
+    no arquivo.
+    """
+    conexao = conectar_banco()
+    anteriores = {}
+    estoque_salvo = False
+    hoje = obter_data_atual()
+    vendas_antigas = [v for v in vendas if v["Data"] < hoje]
+    try:
+        with conexao:
+            _registrar_vendas(conexao, [v for v in vendas if v["Data"] >= hoje])
+            if vendas_antigas:
+                _inserir_historico(conexao, vendas_antigas)
+                atualizar_resumos(conexao, vendas_antigas)
+            if carrinho_id:
+                _descartar_carrinho(conexao, carrinho_id)
+            if chaves:
+                _gravar_chaves_sincronizacao(conexao, chaves)
+            anteriores = baixar_estoque(produtos, baixas)
+            if anteriores:
+                salvar_produtos(produtos)
+                estoque_salvo = True
+        invalidar_prefixo("vendas:")
+    except Exception as e:
+        restaurar_estoque(produtos, anteriores)
+        if estoque_salvo:
+            salvar_produtos(produtos)
+        registrar_log(f"Erro ao registrar pedido: {str(e)}")
+        raise
 
-def salvar_venda_diaria(venda):
-    """Salva venda diária."""
+# ---------------------------------------------------------------------
+# MÓDULO: RESUMOS DE VENDAS (vendas.db, tabelas resumo_*)
+#
+# Totais por dia mantidos junto com cada venda gravada, na mesma transação.
+# O fechamento de caixa de qualquer dia vira uma consulta por chave primária.
+# resumo_periodo guarda totais por dia, semana ISO e mês, no geral, por
+# produto e por cliente, para o painel de vendas por período.
+# reconstruir_resumos (comando "flask reconstruir-resumos") refaz tudo a
+# partir das linhas de venda.
+
+PERIODOS_RESUMO = ("dia", "semana", "mes")
+DIMENSOES_RESUMO = ("total", "produto", "cliente")
+
+def semana_iso(data):
+    """Semana ISO de uma data AAAA-MM-DD no formato AAAA-Www (ex.: 2026-W42)."""
     try:
-        df_nova = pd.DataFrame([venda])
+        ano, semana, _ = date.fromisoformat(str(data)[:10]).isocalendar()
+    except (TypeError, ValueError):
+        return ""
+    return f"{ano}-W{semana:02d}"
+
+def chaves_periodo(data):
+    """Chaves de dia, semana e mês de uma data."""
+    data = str(data or "")[:10]
+    return {"dia": data, "semana": semana_iso(data), "mes": data[:7]}
+
+SQL_SOMAR_PERIODO = """
+    INSERT INTO resumo_periodo (Periodo, Dimensao, Chave_Periodo, Chave, Nome, Quantidade, Valor_Total, Linhas)
+    {origem}
+    ON CONFLICT (Periodo, Dimensao, Chave_Periodo, Chave) DO UPDATE SET
+        Nome = excluded.Nome,
+        Quantidade = Quantidade + excluded.Quantidade,
+        Valor_Total = Valor_Total + excluded.Valor_Total,
+        Linhas = Linhas + excluded.Linhas
+"""
+
+def atualizar_resumos(conexao, vendas):
+    """Soma as vendas informadas nos resumos (sem commit; use dentro de uma transação)."""
+    por_dia = {}
+    por_pagamento = {}
+    por_periodo = {}
+    for venda in vendas:
+        data = str(venda.get("Data") or "")[:10]
+        valor = float(venda.get("Valor_Total") or 0)
+        if not math.isfinite(valor):
+            raise ValueError(f"Valor_Total inválido na venda de {data}: {valor}")
+        pago = valor if str(venda.get("Status_Pagamento", "")).lower() == "pago" else 0.0
         
-        if os.path.exists("vendas.xlsx"):
-            wb = load_workbook("vendas.xlsx")
-            if "Diario" in wb.sheetnames:
-                df_existente = pd.read_excel("vendas.xlsx", sheet_name="Diario")
-                df_atualizado = pd.concat([df_existente, df_nova], ignore_index=True)
-                del wb["Diario"]
-            else:
-                df_atualizado = df_nova
-            ws = wb.create_sheet("Diario")
-        else:
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Diario"
-            df_atualizado = df_nova
+        dia = por_dia.setdefault(data, [0.0, 0.0, 0.0, 0])
+        dia[0] += valor
+        dia[1] += pago
+        dia[2] += valor - pago
+        dia[3] += 1
         
-        for r in dataframe_to_rows(df_atualizado, index=False, header=True):
-            ws.append(r)
+        forma = por_pagamento.setdefault((data, str(venda.get("Forma_Pagamento") or "")), [0.0, 0])
+        forma[0] += valor
+        forma[1] += 1
         
-        wb.save("vendas.xlsx")
-    except Exception as e:
-        registrar_log(f"Erro ao salvar venda: {str(e)}")
-        raise
+        quantidade = float(venda.get("Quantidade_Total") or 0)
+        if not math.isfinite(quantidade):
+            raise ValueError(f"Quantidade_Total inválida na venda de {data}: {quantidade}")
+        cliente_id = venda.get("Cliente_ID")
+        if isinstance(cliente_id, float) and cliente_id.is_integer():
+            cliente_id = int(cliente_id)
+        dimensoes = {
+            "total": ("", ""),
+            "produto": (str(venda.get("Produto_Nome") or ""), str(venda.get("Produto_Nome") or "")),
+            "cliente": (str(cliente_id or ""), str(venda.get("Cliente_Nome") or ""))
+        }
+        for periodo, chave_periodo in chaves_periodo(data).items():
+            for dimensao, (chave, nome) in dimensoes.items():
+                acumulado = por_periodo.setdefault((periodo, dimensao, chave_periodo, chave), [nome, 0.0, 0.0, 0])
+                acumulado[1] += quantidade
+                acumulado[2] += valor
+                acumulado[3] += 1
+    
+    conexao.executemany("""
+        INSERT INTO resumo_diario (Data, Total_Vendas, Total_Pago, Total_Pendente, Linhas)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (Data) DO UPDATE SET
+            Total_Vendas = Total_Vendas + excluded.Total_Vendas,
+            Total_Pago = Total_Pago + excluded.Total_Pago,
+            Total_Pendente = Total_Pendente + excluded.Total_Pendente,
+            Linhas = Linhas + excluded.Linhas
+    """, [(data, *totais) for data, totais in por_dia.items()])
+    conexao.executemany("""
+        INSERT INTO resumo_diario_pagamento (Data, Forma_Pagamento, Total, Linhas)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (Data, Forma_Pagamento) DO UPDATE SET
+            Total = Total + excluded.Total,
+            Linhas = Linhas + excluded.Linhas
+    """, [(data, forma, *totais) for (data, forma), totais in por_pagamento.items()])
+    conexao.executemany(
+        SQL_SOMAR_PERIODO.format(origem="VALUES (?, ?, ?, ?, ?, ?, ?, ?)"),
+        [(*chave, *totais) for chave, totais in por_periodo.items()]
+    )
+
+def reconstruir_resumos(conexao=None):
+    """Apaga e recalcula os resumos a partir do diario e de todo o histórico."""
+    conexao = conexao or conectar_banco()
+    with conexao:
+        conexao.execute("DELETE FROM resumo_diario")
+        conexao.execute("DELETE FROM resumo_diario_pagamento")
+        conexao.execute("DELETE FROM resumo_periodo")
+        expressoes_periodo = {
+            "dia": "substr(Data, 1, 10)",
+            "semana": "semana_iso(Data)",
+            "mes": "substr(Data, 1, 7)"
+        }
+        expressoes_dimensao = {
+            "total": ("''", "''"),
+            "produto": ("COALESCE(Produto_Nome, '')", "COALESCE(Produto_Nome, '')"),
+            "cliente": ("COALESCE(CAST(Cliente_ID AS TEXT), '')", "COALESCE(MAX(Cliente_Nome), '')")
+        }
+        for tabela in tabelas_vendas(conexao):
+            for periodo, expressao_periodo in expressoes_periodo.items():
+                for dimensao, (expressao_chave, expressao_nome) in expressoes_dimensao.items():
+                    conexao.execute(SQL_SOMAR_PERIODO.format(origem=f"""
+                        SELECT '{periodo}', '{dimensao}', COALESCE({expressao_periodo}, ''), {expressao_chave},
+                               {expressao_nome}, SUM(COALESCE(Quantidade_Total, 0)),
+                               SUM(COALESCE(Valor_Total, 0)), COUNT(*)
+                        FROM {tabela} WHERE 1
+                        GROUP BY COALESCE({expressao_periodo}, ''), {expressao_chave}
+                    """))
+            conexao.execute(f"""
+                INSERT INTO resumo_diario (Data, Total_Vendas, Total_Pago, Total_Pendente, Linhas)
+                SELECT COALESCE(Data, ''), SUM(COALESCE(Valor_Total, 0)),
+                       SUM(CASE WHEN lower(Status_Pagamento) = 'pago' THEN COALESCE(Valor_Total, 0) ELSE 0 END),
+                       SUM(CASE WHEN lower(Status_Pagamento) = 'pago' THEN 0 ELSE COALESCE(Valor_Total, 0) END),
+                       COUNT(*)
+                FROM {tabela} WHERE 1 GROUP BY COALESCE(Data, '')
+                ON CONFLICT (Data) DO UPDATE SET
+                    Total_Vendas = Total_Vendas + excluded.Total_Vendas,
+                    Total_Pago = Total_Pago + excluded.Total_Pago,
+                    Total_Pendente = Total_Pendente + excluded.Total_Pendente,
+                    Linhas = Linhas + excluded.Linhas
+            """)
+            conexao.execute(f"""
+                INSERT INTO resumo_diario_pagamento (Data, Forma_Pagamento, Total, Linhas)
+                SELECT COALESCE(Data, ''), COALESCE(Forma_Pagamento, ''), SUM(COALESCE(Valor_Total, 0)), COUNT(*)
+                FROM {tabela} WHERE 1 GROUP BY COALESCE(Data, ''), COALESCE(Forma_Pagamento, '')
+                ON CONFLICT (Data, Forma_Pagamento) DO UPDATE SET
+                    Total = Total + excluded.Total,
+                    Linhas = Linhas + excluded.Linhas
+            """)
+    invalidar_prefixo("vendas:")
+    registrar_log("Resumos de vendas reconstruídos")
+
+def obter_resumo_dia(data):
+    """Resumo de um dia: totais, linhas e total por forma de pagamento (None se não houve vendas)."""
+    conexao = conectar_banco()
+    linha = conexao.execute(
+        "SELECT Data, Total_Vendas, Total_Pago, Total_Pendente, Linhas FROM resumo_diario WHERE Data = ?",
+        (data,)
+    ).fetchone()
+    if not linha or not linha["Linhas"]:
+        return None
+    resumo = dict(linha)
+    resumo["Por_Pagamento"] = {
+        forma: total for forma, total in conexao.execute(
+            "SELECT Forma_Pagamento, Total FROM resumo_diario_pagamento WHERE Data = ? ORDER BY Forma_Pagamento",
+            (data,)
+        )
+    }
+    return resumo
+
+def obter_resumo_periodos(periodo, limite=12):
+    """Totais dos últimos `limite` períodos (dia, semana ou mês), do mais recente ao mais antigo."""
+    return _consultar_vendas("""
+        SELECT Chave_Periodo, Quantidade, Valor_Total, Linhas FROM resumo_periodo
+        WHERE Periodo = ? AND Dimensao = 'total'
+        ORDER BY Chave_Periodo DESC LIMIT ?
+    """, (periodo, limite))
+
+def obter_ranking_periodo(periodo, chave_periodo, dimensao, limite=10):
+    """Maiores produtos ou clientes de um período, por valor vendido."""
+    return _consultar_vendas("""
+        SELECT Chave, Nome, Quantidade, Valor_Total, Linhas FROM resumo_periodo
+        WHERE Periodo = ? AND Dimensao = ? AND Chave_Periodo = ?
+        ORDER BY Valor_Total DESC LIMIT ?
+    """, (periodo, dimensao, chave_periodo, limite))
+
+# Desempenho dos produtos: as linhas diárias por produto do resumo_periodo
+# são os contadores, somados a cada venda gravada e recalculados em SQL pelo
+# reconstruir_resumos. Uma janela de N dias lê só N dias de contadores (e
+# outros N para a tendência), qualquer que seja o tamanho do histórico.
+
+JANELAS_DESEMPENHO = (7, 30, 90)
+
+def carregar_desempenho(janela, hoje):
+    """Vendas por produto nos últimos `janela` dias e nos `janela` dias anteriores."""
+    fim = date.fromisoformat(hoje)
+    inicio = fim - timedelta(days=janela - 1)
+    inicio_anterior = inicio - timedelta(days=janela)
+    return {
+        linha["Chave"]: linha for linha in _consultar_vendas("""
+            SELECT Chave,
+                   SUM(CASE WHEN Chave_Periodo >= :inicio THEN Quantidade ELSE 0 END) AS Quantidade,
+                   SUM(CASE WHEN Chave_Periodo >= :inicio THEN Valor_Total ELSE 0 END) AS Valor_Total,
+                   SUM(CASE WHEN Chave_Periodo < :inicio THEN Valor_Total ELSE 0 END) AS Valor_Anterior
+            FROM resumo_periodo
+            WHERE Periodo = 'dia' AND Dimensao = 'produto' AND Chave_Periodo BETWEEN :anterior AND :fim
+            GROUP BY Chave
+        """, {"inicio": inicio.isoformat(), "anterior": inicio_anterior.isoformat(), "fim": hoje})
+    }
+
+def obter_desempenho(janela):
+    """Vendas por produto da janela em memória (recalculadas quando há vendas novas)."""
+    hoje = obter_data_atual()
+    return obter_dados(f"vendas:desempenho:{janela}:{hoje}", ARQUIVOS_BANCO,
+                       lambda: carregar_desempenho(janela, hoje))
+
+def desempenho_produtos(produtos, janela):
+    """Unidades, receita, participação e tendência de cada produto, do maior para o menor."""
+    vendas = obter_desempenho(janela)
+    total = sum(linha["Valor_Total"] for linha in vendas.values())
+    desempenhos = []
+    for produto in produtos:
+        linha = vendas.get(produto["nome"], {})
+        valor = linha.get("Valor_Total") or 0.0
+        anterior = linha.get("Valor_Anterior") or 0.0
+        tendencia = (valor - anterior) / anterior * 100 if anterior else None
+        participacao = valor / total * 100 if total else 0.0
+        desempenhos.append({
+            "id": produto["id"],
+            "nome": produto["nome"],
+            "tipo": produto["tipo"],
+            "quantidade": linha.get("Quantidade") or 0.0,
+            "valor_total": valor,
+            "participacao": participacao,
+            "tendencia": tendencia,
+            "desempenho": f"R$ {valor:.2f} ({participacao:.1f}% das vendas)"
+        })
+    desempenhos.sort(key=lambda d: (-d["valor_total"], d["nome"]))
+    return desempenhos
+
+@app.cli.command("reconstruir-resumos")
+def reconstruir_resumos_comando():
+    """Recalcula os resumos de vendas a partir das linhas gravadas."""
+    reconstruir_resumos()
+    descarregar_log()
+    print("Resumos reconstruídos.")
+
+# ---------------------------------------------------------------------
+# MÓDULO: RESERVAS DE ESTOQUE (vendas.db, tabela reservas_estoque)
+#
+# Ao entrar no carrinho, a quantidade de um produto com estoque controlado
+# fica reservada por TEMPO_RESERVA segundos. Cada reserva é uma linha por
+# produto, gravada numa transação BEGIN IMMEDIATE: ela pega a trava de
+# escrita do vendas.db, então as reservas (e as demais gravações no banco)
+# de todos os workers acontecem uma de cada vez. A transação é curta e não
+# pega a trava do estoque.xlsx. Reservas vencidas deixam de contar e são
+# apagadas na próxima reserva. Na finalização, a baixa só acontece se o estoque menos o
+# que está reservado por outros carrinhos ainda cobrir o pedido.
+
+TEMPO_RESERVA = 15 * 60
+
+def novo_carrinho_id():
+    """Gera um identificador para o carrinho da sessão."""
+    return uuid.uuid4().hex
+
+def quantidade_reservada(produto_id, exceto_carrinho=None, conexao=None):
+    """Soma as reservas ainda válidas do produto (opcionalmente sem as de um carrinho)."""
+    conexao = conexao or conectar_banco()
+    linha = conexao.execute(
+        "SELECT COALESCE(SUM(Quantidade), 0) FROM reservas_estoque "
+        "WHERE Produto_ID = ? AND Expira > ? AND Carrinho IS NOT ?",
+        (produto_id, time.time(), exceto_carrinho)
+    ).fetchone()
+    return linha[0]
+
+def reservar_estoque(carrinho_id, produto, quantidade):
+    """Reserva quantidade do produto para o carrinho; retorna mensagem de erro ou None."""
+    if not produto["controlar_estoque"]:
+        return None
+    
+    conexao = conectar_banco()
+    agora = time.time()
+    with conexao:
+        conexao.execute("BEGIN IMMEDIATE")
+        conexao.execute("DELETE FROM reservas_estoque WHERE Expira <= ?", (agora,))
+        disponivel = produto["quantidade"] - quantidade_reservada(produto["id"], conexao=conexao)
+        if disponivel < quantidade:
+            return f"Estoque insuficiente! Disponível: {max(disponivel, 0)}"
+        conexao.execute(
+            "UPDATE reservas_estoque SET Expira = ? WHERE Carrinho = ?",
+            (agora + TEMPO_RESERVA, carrinho_id)
+        )
+        conexao.execute(
+            "INSERT INTO reservas_estoque (Carrinho, Produto_ID, Quantidade, Expira) VALUES (?, ?, ?, ?)",
+            (carrinho_id, produto["id"], quantidade, agora + TEMPO_RESERVA)
+        )
+    return None
+
+def _apagar_reservas(conexao, carrinho_id):
+    """Remove as reservas do carrinho (dentro de uma transação)."""
+    conexao.execute("DELETE FROM reservas_estoque WHERE Carrinho = ?", (carrinho_id,))
+
+def verificar_baixas(produtos, baixas, carrinho_id=None, ja_baixadas=None):
+    """Confere se o estoque atual cobre as baixas, descontando reservas de outros carrinhos.
+    
+    ja_baixadas são quantidades ainda não gravadas (pedidos anteriores do
+    mesmo lote). Deve ser chamada sob a trava de estoque.xlsx, junto com a
+    baixa. Retorna mensagem de erro ou None.
+    """
+    conexao = conectar_banco()
+    ja_baixadas = ja_baixadas or {}
+    for produto_id, quantidade in baixas.items():
+        produto = buscar_por_id(produtos, produto_id)
+        if not produto or not produto["controlar_estoque"]:
+            continue
+        disponivel = (produto["quantidade"] - ja_baixadas.get(produto_id, 0)
+                      - quantidade_reservada(produto_id, carrinho_id, conexao))
+        if disponivel < quantidade:
+            return f"Erro: Estoque insuficiente de {produto['nome']}! Disponível: {max(disponivel, 0)}"
+    return None
 
 # ---------------------------------------------------------------------
-# MÓDULO: CARRINHO DE VENDAS
+# MÓDULO: CARRINHO DE VENDAS (vendas.db, tabela carrinhos)
+#
+# A sessão guarda só o carrinho_id; os itens ficam no banco como
+# (produto, quantidade digitada). Nome, preço e totais são calculados a
+# partir do catálogo na hora de exibir e de finalizar. Carrinhos parados há
+# mais de TEMPO_CARRINHO segundos são descartados.
+
+TEMPO_CARRINHO = 24 * 60 * 60
 
 def inicializar_carrinho():
     """Inicializa carrinho."""
-    if 'carrinho' not in session:
-        session['carrinho'] = []
+    session.pop('carrinho', None)
     if 'cliente_id_carrinho' not in session:
         session['cliente_id_carrinho'] = None
+    if not session.get('carrinho_id'):
+        session['carrinho_id'] = novo_carrinho_id()
 
-def adicionar_item_carrinho(produtos, produto_id, quantidade_input):
-    """Adiciona item ao carrinho."""
-    produto = next((p for p in produtos if p["id"] == produto_id), None)
-    if not produto:
-        return None, "Produto não encontrado!"
+def calcular_item(produto, quantidade_validada):
+    """Monta o item do carrinho com nome, quantidades e valores atuais do produto.
     
-    quantidade_validada = validar_numero_positivo(quantidade_input)
-    if not quantidade_validada:
-        return None, "Quantidade inválida!"
+    Retorna None se a quantidade estoura os totais (não finitos).
+    """
+    quantidade_total = quantidade_validada * 30 if produto["tipo"] == "esteira" else quantidade_validada
+    valor_total = round(quantidade_total * produto["valor"], 2)
+    if not (math.isfinite(quantidade_total) and math.isfinite(valor_total)):
+        return None
     
     if produto["tipo"] == "esteira":
-        quantidade_total = quantidade_validada * 30
-        valor_total = round(quantidade_total * produto["valor"], 2)
         descricao = f"{int(quantidade_validada)} esteiras ({int(quantidade_total)} pães)"
     elif produto["tipo"] == "quilo":
-        quantidade_total = quantidade_validada
-        valor_total = round(quantidade_validada * produto["valor"], 2)
         descricao = f"{quantidade_validada} kg"
     else:
-        quantidade_total = quantidade_validada
-        valor_total = round(quantidade_validada * produto["valor"], 2)
         descricao = f"{int(quantidade_validada)} unidades"
     
-    if produto["controlar_estoque"] and produto["quantidade"] < quantidade_total:
-        return None, f"Estoque insuficiente! Disponível: {produto['quantidade']}"
-    
-    item = {
-        "produto_id": produto_id,
+    return {
+        "produto_id": produto["id"],
         "produto_nome": produto["nome"],
         "tipo_produto": produto["tipo"],
         "quantidade_input": quantidade_validada,
@@ -432,22 +2055,87 @@ def adicionar_item_carrinho(produtos, produto_id, quantidade_input):
         "valor_total": valor_total,
         "descricao": descricao
     }
+
+def guardar_item_carrinho(carrinho_id, produto_id, quantidade_input):
+    """Grava o item no carrinho e descarta carrinhos abandonados."""
+    conexao = conectar_banco()
+    agora = time.time()
+    with conexao:
+        conexao.execute("DELETE FROM carrinhos WHERE Atualizado <= ?", (agora - TEMPO_CARRINHO,))
+        conexao.execute("UPDATE carrinhos SET Atualizado = ? WHERE Carrinho = ?", (agora, carrinho_id))
+        conexao.execute(
+            "INSERT INTO carrinhos (Carrinho, Produto_ID, Quantidade_Input, Atualizado) VALUES (?, ?, ?, ?)",
+            (carrinho_id, produto_id, quantidade_input, agora)
+        )
+
+def carregar_carrinho(produtos, carrinho_id):
+    """Retorna os itens do carrinho com os preços atuais do catálogo."""
+    if not carrinho_id:
+        return []
+    linhas = conectar_banco().execute(
+        "SELECT Produto_ID, Quantidade_Input FROM carrinhos WHERE Carrinho = ? ORDER BY id",
+        (carrinho_id,)
+    ).fetchall()
+    carrinho = []
+    for produto_id, quantidade_input in linhas:
+        produto = buscar_por_id(produtos, produto_id)
+        item = calcular_item(produto, quantidade_input) if produto else None
+        if item:
+            carrinho.append(item)
+    return carrinho
+
+def _descartar_carrinho(conexao, carrinho_id):
+    """Apaga itens e reservas do carrinho (dentro de uma transação)."""
+    conexao.execute("DELETE FROM carrinhos WHERE Carrinho = ?", (carrinho_id,))
+    _apagar_reservas(conexao, carrinho_id)
+
+def esvaziar_carrinho(carrinho_id):
+    """Esvazia o carrinho e libera o estoque reservado para ele."""
+    if not carrinho_id:
+        return
+    conexao = conectar_banco()
+    with conexao:
+        _descartar_carrinho(conexao, carrinho_id)
+
+def adicionar_item_carrinho(produtos, produto_id, quantidade_input, carrinho_id):
+    """Adiciona item ao carrinho, reservando o estoque."""
+    produto = buscar_por_id(produtos, produto_id)
+    if not produto:
+        return None, "Produto não encontrado!"
+    
+    quantidade_validada = validar_numero_positivo(quantidade_input)
+    if not quantidade_validada:
+        return None, "Quantidade inválida!"
+    
+    item = calcular_item(produto, quantidade_validada)
+    if not item:
+        return None, "Quantidade inválida!"
+    erro = reservar_estoque(carrinho_id, produto, item["quantidade_total"])
+    if erro:
+        return None, erro
+    
+    guardar_item_carrinho(carrinho_id, produto_id, quantidade_validada)
     return item, None
 
-def finalizar_pedido(clientes, produtos, cliente_id, carrinho, forma_pagamento):
-    """Finaliza pedido."""
-    cliente = next((c for c in clientes if c["id"] == cliente_id), None)
+def montar_pedido(clientes, cliente_id, carrinho, forma_pagamento):
+    """Monta as linhas de venda e as baixas de estoque de um pedido.
+    
+    Retorna (vendas, baixas, total, erro).
+    """
+    cliente = buscar_por_id(clientes, cliente_id)
     if not cliente:
-        return "Erro: Cliente não encontrado!"
+        return None, None, 0, "Erro: Cliente não encontrado!"
     
     if not carrinho:
-        return "Erro: Carrinho vazio!"
+        return None, None, 0, "Erro: Carrinho vazio!"
     
     total_pedido = sum(item["valor_total"] for item in carrinho)
     data_venda = obter_data_atual()
     
+    vendas = []
+    baixas = {}
     for item in carrinho:
-        venda = {
+        vendas.append({
             "Cliente_ID": cliente_id,
             "Cliente_Nome": cliente["nome"],
             "Produto_Nome": item["produto_nome"],
@@ -459,13 +2147,200 @@ def finalizar_pedido(clientes, produtos, cliente_id, carrinho, forma_pagamento):
             "Forma_Pagamento": forma_pagamento,
             "Status_Pagamento": "Pago" if forma_pagamento != "pendente" else "Pendente",
             "Data": data_venda
-        }
-        salvar_venda_diaria(venda)
-        atualizar_estoque(produtos, item["produto_id"], item["quantidade_total"])
+        })
+        baixas[item["produto_id"]] = baixas.get(item["produto_id"], 0) + item["quantidade_total"]
+    return vendas, baixas, total_pedido, None
+
+def finalizar_pedido(clientes, produtos, cliente_id, carrinho, forma_pagamento, carrinho_id=None):
+    """Finaliza pedido."""
+    vendas, baixas, total_pedido, erro = montar_pedido(clientes, cliente_id, carrinho, forma_pagamento)
+    if erro:
+        return erro
+    
+    erro = verificar_baixas(produtos, baixas, carrinho_id)
+    if erro:
+        return erro
     
-    registrar_log(f"Pedido: {cliente['nome']} - R$ {total_pedido:.2f}")
+    registrar_pedido(produtos, vendas, baixas, carrinho_id)
+    registrar_log(f"Pedido: {vendas[0]['Cliente_Nome']} - R$ {total_pedido:.2f}")
     return f"Pedido finalizado! Total: R$ {total_pedido:.2f}"
 
+# ---------------------------------------------------------------------
+# MÓDULO: PEDIDOS VIA API
+#
+# Terminais e tablets mandam o pedido completo (ou um lote deles) em JSON.
+# Cada pedido passa pela mesma montagem e conferência de estoque do
+# finalizar_pedido; os aceitos do lote são gravados juntos, numa transação
+# do vendas.db e uma única regravação do estoque.xlsx.
+
+FORMAS_PAGAMENTO = ["pix", "cartao", "deposito", "dinheiro", "pendente"]
+LIMITE_PEDIDOS_POR_LOTE = 500
+
+def montar_itens(produtos, itens):
+    """Valida as linhas {produto_id, quantidade} contra o catálogo; retorna (carrinho, erro)."""
+    if not isinstance(itens, list) or not itens:
+        return None, "Erro: Pedido sem itens!"
+    carrinho = []
+    for numero, linha in enumerate(itens, 1):
+        if not isinstance(linha, dict):
+            return None, f"Erro: Item {numero} inválido!"
+        try:
+            produto = buscar_por_id(produtos, int(linha.get("produto_id")))
+        except (TypeError, ValueError):
+            produto = None
+        if not produto:
+            return None, f"Erro: Item {numero}: produto não encontrado!"
+        quantidade = validar_numero_positivo(linha.get("quantidade"))
+        if not quantidade:
+            return None, f"Erro: Item {numero}: quantidade inválida!"
+        item = calcular_item(produto, quantidade)
+        if not item:
+            return None, f"Erro: Item {numero}: quantidade inválida!"
+        carrinho.append(item)
+    return carrinho, None
+
+def _validar_pedido(clientes, produtos, pedido):
+    """Monta um pedido recebido em JSON; retorna (vendas, baixas, total, erro)."""
+    if not isinstance(pedido, dict):
+        return None, None, 0, "Erro: Pedido inválido!"
+    forma_pagamento = pedido.get("forma_pagamento", "pendente")
+    if forma_pagamento not in FORMAS_PAGAMENTO:
+        return None, None, 0, "Erro: Forma de pagamento inválida!"
+    try:
+        cliente_id = int(pedido.get("cliente_id"))
+    except (TypeError, ValueError):
+        return None, None, 0, "Erro: Cliente não encontrado!"
+    carrinho, erro = montar_itens(produtos, pedido.get("itens"))
+    if erro:
+        return None, None, 0, erro
+    return montar_pedido(clientes, cliente_id, carrinho, forma_pagamento)
+
+def finalizar_pedidos(clientes, produtos, pedidos):
+    """Finaliza uma lista de pedidos; retorna um resultado por pedido, na ordem recebida.
+    
+    Cada pedido é conferido contra o estoque que sobra depois dos anteriores
+    do lote; um pedido recusado não impede os demais.
+    """
+    resultados = []
+    vendas_lote = []
+    baixas_lote = {}
+    total_lote = 0
+    for indice, pedido in enumerate(pedidos):
+        vendas, baixas, total, erro = _validar_pedido(clientes, produtos, pedido)
+        if not erro:
+            erro = verificar_baixas(produtos, baixas, ja_baixadas=baixas_lote)
+        if erro:
+            resultados.append({"indice": indice, "ok": False, "erro": erro})
+            continue
+        for produto_id, quantidade in baixas.items():
+            baixas_lote[produto_id] = baixas_lote.get(produto_id, 0) + quantidade
+        vendas_lote.extend(vendas)
+        total_lote += total
+        resultados.append({"indice": indice, "ok": True, "total": round(total, 2), "itens": len(vendas)})
+    
+    if vendas_lote:
+        registrar_pedido(produtos, vendas_lote, baixas_lote)
+        aceitos = sum(1 for r in resultados if r["ok"])
+        registrar_log(f"API: {aceitos} pedidos finalizados - R$ {total_lote:.2f}")
+    return resultados
+
+# ---------------------------------------------------------------------
+# MÓDULO: SINCRONIZAÇÃO DE TERMINAIS (vendas.db, tabela chaves_sincronizacao)
+#
+# Sem conexão, o terminal continua vendendo e enfileira os pedidos, cada um
+# com uma chave gerada por ele. Na volta, manda a fila em lotes. A chave é a
+# chave primária de chaves_sincronizacao: um pedido reenviado não é gravado
+# de novo e recebe o mesmo resultado da primeira vez. Só os pedidos gravados
+# guardam a chave; um recusado pode ser corrigido e reenviado com a mesma
+# chave. As vendas já
+# aconteceram, então a falta de estoque não recusa o pedido: a baixa é
+# aplicada e os produtos que ficaram negativos são informados.
+
+LIMITE_VENDAS_POR_SINCRONIZACAO = 5000
+_LOTE_CONSULTA_CHAVES = 500
+
+def _gravar_chaves_sincronizacao(conexao, chaves):
+    """Grava [(chave, terminal, resultado)] (dentro de uma transação)."""
+    agora = time.time()
+    conexao.executemany(
+        "INSERT INTO chaves_sincronizacao (Chave, Terminal, Recebido, Resultado) VALUES (?, ?, ?, ?)",
+        [(chave, terminal, agora, json.dumps(resultado)) for chave, terminal, resultado in chaves]
+    )
+
+def consultar_chaves_sincronizacao(chaves):
+    """Resultados já gravados para as chaves informadas: {chave: resultado}."""
+    conexao = conectar_banco()
+    chaves = list(chaves)
+    encontradas = {}
+    for inicio in range(0, len(chaves), _LOTE_CONSULTA_CHAVES):
+        lote = chaves[inicio:inicio + _LOTE_CONSULTA_CHAVES]
+        for chave, resultado in conexao.execute(
+            f"SELECT Chave, Resultado FROM chaves_sincronizacao WHERE Chave IN ({', '.join('?' for _ in lote)})",
+            lote
+        ):
+            encontradas[chave] = json.loads(resultado)
+    return encontradas
+
+def _data_da_venda_offline(pedido):
+    """Data informada pelo terminal (AAAA-MM-DD, não futura) ou hoje; None se inválida."""
+    try:
+        data = date.fromisoformat(pedido.get("data") or obter_data_atual())
+    except (TypeError, ValueError):
+        return None
+    return data.isoformat() if data <= date.today() else None
+
+def sincronizar_vendas(clientes, produtos, pedidos, terminal=None):
+    """Aplica, em ordem, os pedidos enfileirados por um terminal.
+    
+    Retorna (resultados, estoque_negativo). Tudo o que é novo no lote é
+    gravado numa transação do vendas.db e numa regravação do estoque.xlsx.
+    """
+    chaves = [p.get("chave") for p in pedidos if isinstance(p, dict) and isinstance(p.get("chave"), str)]
+    ja_recebidas = consultar_chaves_sincronizacao(set(chaves))
+    
+    resultados = []
+    vendas_lote = []
+    baixas_lote = {}
+    chaves_novas = []
+    for indice, pedido in enumerate(pedidos):
+        chave = pedido.get("chave") if isinstance(pedido, dict) else None
+        if not isinstance(chave, str) or not chave.strip():
+            resultados.append({"indice": indice, "ok": False, "erro": "Erro: Chave de idempotência ausente!"})
+            continue
+        if chave in ja_recebidas:
+            resultados.append(dict(ja_recebidas[chave], indice=indice, chave=chave, duplicado=True))
+            continue
+        
+        vendas, baixas, total, erro = _validar_pedido(clientes, produtos, pedido)
+        data = _data_da_venda_offline(pedido)
+        if not erro and data is None:
+            erro = "Erro: Data inválida!"
+        if erro:
+            resultados.append({"indice": indice, "ok": False, "erro": erro, "chave": chave})
+            continue
+        for venda in vendas:
+            venda["Data"] = data
+        vendas_lote.extend(vendas)
+        for produto_id, quantidade in baixas.items():
+            baixas_lote[produto_id] = baixas_lote.get(produto_id, 0) + quantidade
+        resultado = {"ok": True, "total": round(total, 2), "itens": len(vendas)}
+        
+        ja_recebidas[chave] = resultado
+        chaves_novas.append((chave, terminal, resultado))
+        resultados.append(dict(resultado, indice=indice, chave=chave))
+    
+    estoque_negativo = []
+    if chaves_novas:
+        registrar_pedido(produtos, vendas_lote, baixas_lote, chaves=chaves_novas)
+        for produto_id in baixas_lote:
+            produto = buscar_por_id(produtos, produto_id)
+            if produto and produto["controlar_estoque"] and produto["quantidade"] < 0:
+                estoque_negativo.append({"produto_id": produto_id, "nome": produto["nome"],
+                                         "quantidade": produto["quantidade"]})
+        registrar_log(f"Sincronização {terminal or ''}: {len(chaves_novas)} pedidos novos, "
+                      f"{len(vendas_lote)} linhas de venda")
+    return resultados, estoque_negativo
+
 # ---------------------------------------------------------------------
 # MÓDULO: FECHAMENTO DE CAIXA
 
@@ -474,8 +2349,8 @@ def carregar_fechamentos_caixa():
     if not os.path.exists("vendas.xlsx"):
         return []
     try:
-        df = pd.read_excel("vendas.xlsx", sheet_name="Fechamento_Caixa")
-        return df.to_dict('records') if not df.empty else []
+        df = ler_aba("vendas.xlsx", "Fechamento_Caixa")
+        return df.to_dict('records') if df is not None and not df.empty else []
     except:
         return []
 
@@ -484,25 +2359,27 @@ def salvar_fechamento_caixa(fechamento):
     try:
         df_novo = pd.DataFrame([fechamento])
         
-        if os.path.exists("vendas.xlsx"):
-            wb = load_workbook("vendas.xlsx")
-            if "Fechamento_Caixa" in wb.sheetnames:
-                df_existente = pd.read_excel("vendas.xlsx", sheet_name="Fechamento_Caixa")
-                df_atualizado = pd.concat([df_existente, df_novo], ignore_index=True)
-                del wb["Fechamento_Caixa"]
+        with bloqueio_arquivo("vendas.xlsx"):
+            if os.path.exists("vendas.xlsx"):
+                wb = abrir_workbook("vendas.xlsx")
+                if "Fechamento_Caixa" in wb.sheetnames:
+                    df_existente = dataframe_da_aba(wb["Fechamento_Caixa"])
+                    df_atualizado = pd.concat([df_existente, df_novo], ignore_index=True)
+                    del wb["Fechamento_Caixa"]
+                else:
+                    df_atualizado = df_novo
+                ws = wb.create_sheet("Fechamento_Caixa")
             else:
+                wb = Workbook()
+                ws = wb.active
+                ws.title = "Fechamento_Caixa"
                 df_atualizado = df_novo
-            ws = wb.create_sheet("Fechamento_Caixa")
-        else:
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Fechamento_Caixa"
-            df_atualizado = df_novo
         
-        for r in dataframe_to_rows(df_atualizado, index=False, header=True):
-            ws.append(r)
+            for r in dataframe_to_rows(df_atualizado, index=False, header=True):
+                ws.append(r)
         
-        wb.save("vendas.xlsx")
+            salvar_workbook(wb, "vendas.xlsx", preservar=("clientes",))
+            registrar_escrita("fechamentos", ["vendas.xlsx"])
         return True
     except Exception as e:
         registrar_log(f"Erro ao salvar fechamento: {str(e)}")
@@ -516,20 +2393,14 @@ def processar_fechamento_caixa(data_fechamento, pix, cartao, deposito, dinheiro)
         deposito = validar_numero_positivo(deposito) or 0
         dinheiro = validar_numero_positivo(dinheiro) or 0
         
-        vendas_historico = carregar_historico_vendas()
-        vendas_dia = [v for v in vendas_historico if str(v.get("Data", "")) == data_fechamento]
-        
-        if not vendas_dia:
-            vendas_diarias = carregar_vendas_diarias()
-            vendas_dia = [v for v in vendas_diarias if str(v.get("Data", "")) == data_fechamento]
+        resumo = obter_resumo_dia(data_fechamento)
         
-        if not vendas_dia:
+        if not resumo:
             return None, f"Nenhuma venda em {data_fechamento}!"
         
-        total_vendas = sum(float(v.get("Valor_Total", 0)) for v in vendas_dia)
-        total_pago = sum(float(v.get("Valor_Total", 0)) for v in vendas_dia 
-                        if str(v.get("Status_Pagamento", "")).lower() == "pago")
-        total_pendente = total_vendas - total_pago
+        total_vendas = resumo["Total_Vendas"]
+        total_pago = resumo["Total_Pago"]
+        total_pendente = resumo["Total_Pendente"]
         
         total_recebido = pix + cartao + deposito + dinheiro
         diferenca = total_recebido - total_pago
@@ -566,8 +2437,8 @@ def carregar_gastos():
         return {"fixos": [], "variaveis": []}
     try:
         gastos = {}
-        gastos["fixos"] = pd.read_excel("gastos.xlsx", sheet_name="Gastos_Fixos").to_dict('records')
-        gastos["variaveis"] = pd.read_excel("gastos.xlsx", sheet_name="Gastos_Variaveis").to_dict('records')
+        gastos["fixos"] = ler_aba("gastos.xlsx", "Gastos_Fixos").to_dict('records')
+        gastos["variaveis"] = ler_aba("gastos.xlsx", "Gastos_Variaveis").to_dict('records')
         return gastos
     except:
         return {"fixos": [], "variaveis": []}
@@ -594,7 +2465,9 @@ def salvar_gastos(gastos):
         else:
             ws_variaveis.append(["ID", "Descricao", "Valor", "Quantidade", "Data"])
         
-        wb.save("gastos.xlsx")
+        with bloqueio_arquivo("gastos.xlsx"):
+            salvar_workbook(wb, "gastos.xlsx")
+            registrar_escrita("gastos", ["gastos.xlsx"], gastos)
     except Exception as e:
         registrar_log(f"Erro ao salvar gastos: {str(e)}")
         raise
@@ -647,76 +2520,513 @@ def remover_gasto(gastos, tipo_gasto, gasto_id):
 
 # ---------------------------------------------------------------------
 # MÓDULO: FECHAMENTO MENSAL
+#
+# O fechamento não lê linhas de venda: os totais vêm do resumo_diario (no
+# máximo 31 linhas por mês, numa faixa da chave primária) e os gastos de um
+# índice por data montado uma vez a cada mudança do gastos.xlsx. Gastos
+# variáveis contam na data em que foram lançados; gastos fixos são mensais e
+# contam uma vez por mês, no dia do vencimento, a partir do mês do primeiro
+# vencimento (sem vencimento, no dia 1 de todo mês). Um ano inteiro é
+# calculado com uma consulta e gravado com uma única abertura do vendas.xlsx.
 
-def fechamento_mensal():
-    """Cria fechamento mensal."""
-    vendas = carregar_historico_vendas()
-    gastos_data = carregar_gastos()
-    
-    if not vendas:
-        return "Nenhuma venda para fechar!"
-    
-    mes_atual = date.today().strftime("%Y_%m")
-    nome_aba = f"Mes_{mes_atual}"
-    
+def _data_gasto(valor):
+    """Data AAAA-MM-DD de uma célula de gasto (None se vazia ou inválida)."""
     try:
-        if os.path.exists("vendas.xlsx"):
-            wb = load_workbook("vendas.xlsx")
-            if nome_aba in wb.sheetnames:
-                return f"Aba '{nome_aba}' já existe!"
-            wb.close()
-    except:
-        pass
-    
-    vendas_mes = [v for v in vendas if str(v.get("Data", "")).startswith(mes_atual.replace("_", "-"))]
-    
-    if not vendas_mes:
-        return "Nenhuma venda neste mês!"
+        return pd.Timestamp(valor).date().isoformat() if not pd.isna(valor) and valor != "" else None
+    except (TypeError, ValueError):
+        return None
+
+def montar_indice_gastos():
+    """Índice dos gastos: somas acumuladas por dia (variáveis) e lista de fixos."""
+    gastos_data = obter_gastos()
     
-    df_vendas = pd.DataFrame(vendas_mes)
-    total_vendas = df_vendas["Valor_Total"].sum()
+    variaveis = pd.DataFrame(gastos_data["variaveis"], columns=["Valor", "Quantidade", "Data"])
+    variaveis["Data"] = variaveis["Data"].map(_data_gasto)
+    variaveis = variaveis.dropna(subset=["Data"])
+    valores = (pd.to_numeric(variaveis["Valor"], errors="coerce").fillna(0)
+               * pd.to_numeric(variaveis["Quantidade"], errors="coerce").fillna(1))
+    por_dia = valores.groupby(variaveis["Data"]).sum().sort_index()
     
-    total_gastos_fixos = sum(g["Valor"] for g in gastos_data["fixos"])
-    total_gastos_variaveis = sum(g["Valor"] * g.get("Quantidade", 1) for g in gastos_data["variaveis"])
-    total_gastos = total_gastos_fixos + total_gastos_variaveis
+    fixos = []
+    for gasto in gastos_data["fixos"]:
+        vencimento = _data_gasto(gasto.get("Data_Vencimento"))
+        valor = validar_numero_positivo(gasto.get("Valor")) or 0
+        fixos.append((vencimento[:7] if vencimento else "", int(vencimento[8:]) if vencimento else 1, valor))
     
-    lucro = total_vendas - total_gastos
+    return {
+        "datas": list(por_dia.index),
+        "acumulado": [0.0] + por_dia.cumsum().tolist(),
+        "fixos": fixos
+    }
+
+def obter_indice_gastos():
+    """Índice dos gastos em memória (refeito quando o gastos.xlsx muda)."""
+    return obter_dados("gastos:indice", ["gastos.xlsx"], montar_indice_gastos)
+
+def gastos_no_periodo(inicio, fim, indice=None):
+    """Retorna (gastos fixos, gastos variáveis) entre duas datas AAAA-MM-DD, inclusive."""
+    indice = indice or obter_indice_gastos()
+    datas = indice["datas"]
+    acumulado = indice["acumulado"]
+    variaveis = acumulado[bisect.bisect_right(datas, fim)] - acumulado[bisect.bisect_left(datas, inicio)]
     
-    dados_resumo = [
+    fixos = 0.0
+    for mes in meses_entre(inicio[:7], fim[:7]):
+        ultimo_dia = calendar.monthrange(int(mes[:4]), int(mes[5:]))[1]
+        for primeiro_mes, dia, valor in indice["fixos"]:
+            vencimento = f"{mes}-{min(dia, ultimo_dia):02d}"
+            if mes >= primeiro_mes and inicio <= vencimento <= fim:
+                fixos += valor
+    return fixos, variaveis
+
+def meses_entre(primeiro, ultimo):
+    """Meses AAAA-MM de primeiro a ultimo, inclusive."""
+    ano, mes = int(primeiro[:4]), int(primeiro[5:7])
+    meses = []
+    while f"{ano:04d}-{mes:02d}" <= ultimo:
+        meses.append(f"{ano:04d}-{mes:02d}")
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return meses
+
+def vendas_por_mes(inicio, fim):
+    """Totais do resumo_diario entre duas datas, agrupados por mês: {AAAA-MM: dict}."""
+    return {
+        linha["Mes"]: linha for linha in _consultar_vendas("""
+            SELECT substr(Data, 1, 7) AS Mes, SUM(Total_Vendas) AS Total_Vendas,
+                   SUM(Total_Pago) AS Total_Pago, SUM(Total_Pendente) AS Total_Pendente,
+                   SUM(Linhas) AS Linhas
+            FROM resumo_diario WHERE Data BETWEEN ? AND ?
+            GROUP BY substr(Data, 1, 7)
+        """, (inicio, fim))
+    }
+
+def _resumo_fechamento(vendas, gastos_fixos, gastos_variaveis):
+    """Linhas Descricao/Valor gravadas na aba de fechamento."""
+    total_vendas = vendas["Total_Vendas"] if vendas else 0.0
+    total_gastos = gastos_fixos + gastos_variaveis
+    return [
         {"Descricao": "Total Vendas", "Valor": round(total_vendas, 2)},
-        {"Descricao": "Gastos Fixos", "Valor": round(total_gastos_fixos, 2)},
-        {"Descricao": "Gastos Variáveis", "Valor": round(total_gastos_variaveis, 2)},
+        {"Descricao": "Gastos Fixos", "Valor": round(gastos_fixos, 2)},
+        {"Descricao": "Gastos Variáveis", "Valor": round(gastos_variaveis, 2)},
         {"Descricao": "Total Gastos", "Valor": round(total_gastos, 2)},
-        {"Descricao": "Lucro", "Valor": round(lucro, 2)}
+        {"Descricao": "Lucro", "Valor": round(total_vendas - total_gastos, 2)}
     ]
+
+def calcular_fechamento(inicio, fim):
+    """Resumo de vendas e gastos entre duas datas AAAA-MM-DD, inclusive."""
+    por_mes = vendas_por_mes(inicio, fim).values()
+    vendas = {"Total_Vendas": sum(m["Total_Vendas"] for m in por_mes)} if por_mes else None
+    return _resumo_fechamento(vendas, *gastos_no_periodo(inicio, fim))
+
+def limites_do_mes(mes):
+    """Primeiro e último dia do mês AAAA-MM."""
+    ultimo_dia = calendar.monthrange(int(mes[:4]), int(mes[5:]))[1]
+    return f"{mes}-01", f"{mes}-{ultimo_dia:02d}"
+
+def fechar_meses(meses, recalcular=False):
+    """Grava as abas Mes_AAAA_MM dos meses informados; retorna {mes: situação}.
     
-    df_resumo = pd.DataFrame(dados_resumo)
+    Meses sem vendas são ignorados e abas existentes só são refeitas com
+    recalcular=True. Todas as abas são gravadas numa única abertura do
+    vendas.xlsx.
+    """
+    meses = sorted(meses)
+    vendas = vendas_por_mes(limites_do_mes(meses[0])[0], limites_do_mes(meses[-1])[1])
+    situacao = {mes: "sem vendas" for mes in meses if mes not in vendas}
+    if len(situacao) == len(meses):
+        registrar_log(f"Fechamento mensal: nenhuma venda em {', '.join(meses)}")
+        return situacao
+    indice = obter_indice_gastos()
     
+    with bloqueio_arquivo("vendas.xlsx"):
+        if os.path.exists("vendas.xlsx"):
+            wb = abrir_workbook("vendas.xlsx")
+        else:
+            wb = Workbook()
+            wb.remove(wb.active)
+        alterado = False
+        for mes in meses:
+            nome_aba = f"Mes_{mes.replace('-', '_')}"
+            if mes not in vendas:
+                continue
+            posicao = None
+            if nome_aba in wb.sheetnames:
+                if not recalcular:
+                    situacao[mes] = "já fechado"
+                    continue
+                posicao = wb.sheetnames.index(nome_aba)
+                wb.remove(wb[nome_aba])
+            
+            resumo = _resumo_fechamento(vendas[mes], *gastos_no_periodo(*limites_do_mes(mes), indice))
+            ws = wb.create_sheet(nome_aba, posicao)
+            for r in dataframe_to_rows(pd.DataFrame(resumo), index=False, header=True):
+                ws.append(r)
+            situacao[mes] = f"Lucro: R$ {resumo[-1]['Valor']:.2f}"
+            alterado = True
+        if alterado:
+            salvar_workbook(wb, "vendas.xlsx", preservar=("clientes", "fechamentos"))
+    
+    situacao = {mes: situacao[mes] for mes in meses}
+    registrar_log(f"Fechamento mensal: {', '.join(f'{m} ({s})' for m, s in situacao.items())}")
+    return situacao
+
+def fechamento_mensal(mes=None, recalcular=False):
+    """Cria (ou refaz) o fechamento de um mês AAAA-MM; padrão: mês atual."""
+    mes = mes or date.today().strftime("%Y-%m")
+    situacao = fechar_meses([mes], recalcular)[mes]
+    nome_aba = f"Mes_{mes.replace('-', '_')}"
+    if situacao == "sem vendas":
+        return "Nenhuma venda neste mês!"
+    if situacao == "já fechado":
+        return f"Aba '{nome_aba}' já existe!"
+    return f"Fechamento criado: {nome_aba} - {situacao}"
+
+def fechamento_anual(ano, recalcular=False):
+    """Fecha (ou refaz) todos os meses de um ano com vendas."""
+    situacao = fechar_meses(meses_entre(f"{ano}-01", f"{ano}-12"), recalcular)
+    fechados = [mes for mes, texto in situacao.items() if texto.startswith("Lucro")]
+    if not fechados:
+        return f"Nenhum mês fechado em {ano}."
+    return f"Fechamento {ano}: {len(fechados)} meses gravados ({', '.join(fechados)})"
+
+def fechamento_periodo(inicio, fim):
+    """Resumo de um intervalo de datas qualquer (não grava aba)."""
+    resumo = {linha["Descricao"]: linha["Valor"] for linha in calcular_fechamento(inicio, fim)}
+    return (f"Período {inicio} a {fim}: Vendas R$ {resumo['Total Vendas']:.2f} - "
+            f"Gastos R$ {resumo['Total Gastos']:.2f} - Lucro R$ {resumo['Lucro']:.2f}")
+
+def _validar_mes(valor):
+    """Retorna o mês AAAA-MM se válido, senão None."""
     try:
-        wb = load_workbook("vendas.xlsx")
-        ws = wb.create_sheet(nome_aba)
-        for r in dataframe_to_rows(df_resumo, index=False, header=True):
-            ws.append(r)
-        wb.save("vendas.xlsx")
-        registrar_log(f"Fechamento mensal: {nome_aba}")
-        return f"Fechamento criado: {nome_aba} - Lucro: R$ {lucro:.2f}"
-    except Exception as e:
-        return f"Erro: {str(e)}"
+        return datetime.strptime(valor, "%Y-%m").strftime("%Y-%m")
+    except (TypeError, ValueError):
+        return None
+
+def executar_fechamento(mes=None, ano=None, inicio=None, fim=None, recalcular=False):
+    """Escolhe o modo de fechamento pelos parâmetros informados; retorna a mensagem."""
+    if inicio or fim:
+        try:
+            inicio, fim = date.fromisoformat(inicio).isoformat(), date.fromisoformat(fim).isoformat()
+        except (TypeError, ValueError):
+            return "Erro: Datas inválidas!"
+        if inicio > fim:
+            return "Erro: Data inicial maior que a final!"
+        return fechamento_periodo(inicio, fim)
+    if ano:
+        if not re.fullmatch(r"\d{4}", str(ano)):
+            return "Erro: Ano inválido!"
+        return fechamento_anual(str(ano), recalcular)
+    if mes and not _validar_mes(mes):
+        return "Erro: Mês inválido!"
+    return fechamento_mensal(_validar_mes(mes) if mes else None, recalcular)
+
+@app.cli.command("fechamento")
+@click.option("--mes", help="Mês AAAA-MM (padrão: mês atual).")
+@click.option("--ano", help="Fecha todos os meses do ano AAAA.")
+@click.option("--inicio", help="Início de um período AAAA-MM-DD (só exibe o resumo).")
+@click.option("--fim", help="Fim do período AAAA-MM-DD.")
+@click.option("--recalcular", is_flag=True, help="Refaz abas de meses já fechados.")
+def fechamento_comando(mes, ano, inicio, fim, recalcular):
+    """Fecha um mês, um ano inteiro ou resume um período."""
+    print(executar_fechamento(mes, ano, inicio, fim, recalcular))
+    descarregar_log()
+
+# ---------------------------------------------------------------------
+# MÓDULO: EXPORTAÇÃO
+#
+# Os arquivos são gerados em blocos enquanto são enviados: o CSV é escrito
+# linha a linha na resposta e o XLSX usa o modo write_only do openpyxl, que
+# grava as linhas num arquivo temporário. Em nenhum dos dois o conjunto
+# inteiro fica em memória.
+
+LINHAS_POR_BLOCO = 1000
+TAMANHO_BLOCO_ARQUIVO = 64 * 1024
+
+COLUNAS_CLIENTE = ["ID", "Nome", "Telefone", "Observacoes"]
+COLUNAS_PRODUTO = ["ID", "Nome", "Tipo", "Valor", "Controlar_Estoque", "Quantidade", "Corredor", "Prateleira"]
+COLUNAS_GASTO = ["Tipo", "ID", "Descricao", "Valor", "Quantidade", "Data_Vencimento", "Data"]
+
+def linhas_clientes():
+    """Linhas de clientes na ordem de COLUNAS_CLIENTE."""
+    for c in obter_clientes():
+        yield [c["id"], c["nome"], c.get("telefone", ""), c.get("observacoes", "")]
+
+def linhas_produtos():
+    """Linhas de produtos na ordem de COLUNAS_PRODUTO."""
+    for p in obter_produtos():
+        yield [p["id"], p["nome"], p["tipo"], p["valor"], p["controlar_estoque"], p["quantidade"],
+               p.get("corredor"), p.get("prateleira")]
+
+def linhas_gastos():
+    """Linhas de gastos fixos e variáveis na ordem de COLUNAS_GASTO."""
+    dados = obter_gastos()
+    for tipo, chave in (("Fixo", "fixos"), ("Variável", "variaveis")):
+        for g in dados[chave]:
+            linha = [tipo, g.get("ID"), g.get("Descricao"), g.get("Valor"), g.get("Quantidade"),
+                     g.get("Data_Vencimento"), g.get("Data")]
+            yield [None if pd.isna(valor) else valor for valor in linha]
+
+def gerar_csv(colunas, linhas):
+    """Gera o CSV em blocos de LINHAS_POR_BLOCO linhas (com BOM para o Excel)."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    buffer.write("\ufeff")
+    escritor.writerow(colunas)
+    for numero, linha in enumerate(linhas, 1):
+        escritor.writerow(linha)
+        if numero % LINHAS_POR_BLOCO == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def gerar_xlsx(colunas, linhas, aba):
+    """Monta o XLSX em modo write_only num arquivo temporário e o envia em blocos."""
+    descritor, temporario = tempfile.mkstemp(prefix=".exportacao_", suffix=".xlsx")
+    os.close(descritor)
+    try:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(aba)
+        ws.append(colunas)
+        for linha in linhas:
+            ws.append(list(linha))
+        wb.save(temporario)
+        with open(temporario, "rb") as arquivo:
+            while True:
+                bloco = arquivo.read(TAMANHO_BLOCO_ARQUIVO)
+                if not bloco:
+                    break
+                yield bloco
+    finally:
+        os.remove(temporario)
+
+def resposta_exportacao(nome, colunas, linhas, formato):
+    """Resposta em streaming com o arquivo nome.csv ou nome.xlsx."""
+    if formato == "xlsx":
+        corpo = gerar_xlsx(colunas, linhas, nome.capitalize())
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        formato = "csv"
+        corpo = gerar_csv(colunas, linhas)
+        mimetype = "text/csv; charset=utf-8"
+    return Response(corpo, mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename={nome}.{formato}"
+    })
+
+# ---------------------------------------------------------------------
+# MÓDULO: IMPORTAÇÃO EM LOTE
+#
+# Importa produtos ou clientes de um CSV/XLSX. A validação é feita por
+# coluna sobre o DataFrame inteiro; as linhas aceitas entram na lista de uma
+# vez e o arquivo de destino é gravado uma única vez. As linhas recusadas
+# voltam com o número da linha no arquivo e o motivo.
+
+VALORES_VERDADEIROS = {"sim", "s", "true", "verdadeiro", "1", "x"}
+
+def ler_arquivo_importacao(arquivo, nome_arquivo):
+    """Lê CSV (separador , ou ;) ou a primeira aba de um XLSX; colunas em minúsculas sem acento."""
+    if nome_arquivo.lower().endswith(".xlsx"):
+        wb = load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            df = dataframe_da_aba(wb.worksheets[0], dtype=object)
+        finally:
+            wb.close()
+    elif nome_arquivo.lower().endswith(".csv"):
+        df = pd.read_csv(arquivo, dtype=str, sep=None, engine="python", encoding="utf-8-sig",
+                         keep_default_na=False)
+    else:
+        raise ValueError("Formato não suportado (use .csv ou .xlsx)")
+    df.columns = [normalizar_string(str(coluna)).strip() for coluna in df.columns]
+    return df
+
+def _coluna_texto(df, coluna):
+    """Coluna como texto sem espaços nas pontas ('' se ausente ou vazia)."""
+    if coluna not in df.columns:
+        return pd.Series("", index=df.index)
+    return df[coluna].where(df[coluna].notna(), "").astype(str).str.strip()
+
+def _coluna_numero(df, coluna):
+    """Coluna como número, aceitando vírgula decimal (NaN se inválida)."""
+    return pd.to_numeric(_coluna_texto(df, coluna).str.replace(",", ".", regex=False), errors="coerce")
+
+def _marcar(motivos, condicao, motivo):
+    """Atribui motivo às linhas com condicao que ainda não foram recusadas."""
+    return motivos.mask(condicao & (motivos == ""), motivo)
+
+def _separar_rejeitadas(df, motivos, nomes):
+    """Lista de recusas {linha, nome, motivo}; a linha 1 do arquivo é o cabeçalho."""
+    recusadas = motivos != ""
+    return [
+        {"linha": int(indice) + 2, "nome": nomes[indice], "motivo": motivos[indice]}
+        for indice in df.index[recusadas]
+    ], ~recusadas
+
+def _motivos_de_nome(registros, nomes):
+    """Recusa nomes vazios, já cadastrados ou repetidos dentro do arquivo."""
+    chaves = nomes.map(normalizar_string)
+    motivos = pd.Series("", index=nomes.index)
+    motivos = _marcar(motivos, nomes == "", "Nome vazio")
+    motivos = _marcar(motivos, chaves.isin(registros.por_nome.keys()), "Já cadastrado")
+    motivos = _marcar(motivos, chaves.duplicated(), "Repetido no arquivo")
+    return motivos
+
+def importar_produtos(produtos, df):
+    """Valida e acrescenta os produtos do DataFrame; retorna (importados, recusadas)."""
+    nomes = _coluna_texto(df, "nome")
+    tipos = _coluna_texto(df, "tipo").str.lower().map(normalizar_string)
+    valores = _coluna_numero(df, "valor")
+    controlar = _coluna_texto(df, "controlar_estoque").str.lower().isin(VALORES_VERDADEIROS)
+    quantidades = _coluna_numero(df, "quantidade")
+    
+    motivos = _motivos_de_nome(produtos, nomes)
+    motivos = _marcar(motivos, ~tipos.isin(TIPOS_PRODUTO), "Tipo inválido")
+    motivos = _marcar(motivos, ~(valores > 0), "Valor inválido")
+    motivos = _marcar(motivos, controlar & ~(quantidades >= 0), "Quantidade inválida")
+    recusadas, aceitas = _separar_rejeitadas(df, motivos, nomes)
+    
+    novos = pd.DataFrame({
+        "nome": nomes[aceitas],
+        "tipo": tipos[aceitas],
+        "valor": valores[aceitas].astype(float),
+        "controlar_estoque": controlar[aceitas],
+        "quantidade": quantidades[aceitas].where(controlar[aceitas], 0.0).fillna(0.0).astype(float)
+    })
+    novos.insert(0, "id", range(proximo_id(produtos), proximo_id(produtos) + len(novos)))
+    if len(novos):
+        registros = novos.to_dict('records')
+        matriz = obter_matriz()
+        for produto in registros:
+            produto["corredor"], produto["prateleira"] = matriz.alocar(produto["id"])
+        produtos.extend(registros)
+        try:
+            salvar_produtos(produtos)
+        except Exception:
+            del produtos[-len(registros):]
+            for produto in registros:
+                matriz.liberar(produto["id"])
+            raise
+        registrar_escrita("produtos:matriz", ["estoque.xlsx"], matriz)
+    registrar_log(f"Importação de produtos: {len(novos)} importados, {len(recusadas)} recusados")
+    return len(novos), recusadas
+
+def importar_clientes(clientes, df):
+    """Valida e acrescenta os clientes do DataFrame; retorna (importados, recusadas)."""
+    nomes = _coluna_texto(df, "nome")
+    motivos = _motivos_de_nome(clientes, nomes)
+    recusadas, aceitas = _separar_rejeitadas(df, motivos, nomes)
+    
+    novos = pd.DataFrame({
+        "nome": nomes[aceitas],
+        "telefone": _coluna_texto(df, "telefone")[aceitas],
+        "observacoes": _coluna_texto(df, "observacoes")[aceitas]
+    })
+    novos.insert(0, "id", range(proximo_id(clientes), proximo_id(clientes) + len(novos)))
+    if len(novos):
+        registros = novos.to_dict('records')
+        clientes.extend(registros)
+        try:
+            salvar_clientes(clientes)
+        except Exception:
+            del clientes[-len(registros):]
+            raise
+    registrar_log(f"Importação de clientes: {len(novos)} importados, {len(recusadas)} recusados")
+    return len(novos), recusadas
+
+def importar_arquivo(conjunto, arquivo, nome_arquivo):
+    """Importa produtos ou clientes sob a trava do arquivo de destino."""
+    df = ler_arquivo_importacao(arquivo, nome_arquivo)
+    if conjunto == "produtos":
+        with bloqueio_arquivo("estoque.xlsx"):
+            return importar_produtos(obter_produtos(), df)
+    if conjunto == "clientes":
+        with bloqueio_arquivo("vendas.xlsx"):
+            return importar_clientes(obter_clientes(), df)
+    raise ValueError(f"Importação desconhecida: {conjunto}")
+
+@app.cli.command("importar")
+@click.argument("conjunto", type=click.Choice(["produtos", "clientes"]))
+@click.argument("arquivo", type=click.Path(exists=True, dir_okay=False))
+def importar_comando(conjunto, arquivo):
+    """Importa produtos ou clientes de um arquivo CSV/XLSX."""
+    importados, recusadas = importar_arquivo(conjunto, arquivo, arquivo)
+    descarregar_log()
+    print(f"{importados} {conjunto} importados, {len(recusadas)} linhas recusadas.")
+    for recusa in recusadas:
+        print(f"  linha {recusa['linha']}: {recusa['nome'] or '(sem nome)'} - {recusa['motivo']}")
 
 # ---------------------------------------------------------------------
 # ROTAS DO FLASK
 
+LIMITE_VENDAS_POR_CLIENTE = 50
+CLIENTES_POR_PAGINA_RELATORIO = 20
+
 verificar_reset_diario()
+agendar_virada_do_dia()
 
-produtos = carregar_produtos()
-clientes = carregar_clientes()
-gastos = carregar_gastos()
+produtos = ListaIndexada()
+clientes = ListaIndexada()
+gastos = {}
+obter_produtos()
+obter_clientes()
+obter_gastos()
 registrar_log("Sistema iniciado")
 
 @app.before_request
 def before_request():
-    """Verifica reset diário antes de cada requisição."""
-    verificar_reset_diario()
+    """Garante a virada do dia na primeira requisição após a meia-noite (só compara datas em memória)."""
+    if request.endpoint != 'static':
+        g.inicio_requisicao = time.perf_counter()
+        if PERFIL_LENTO:
+            g.perfil = cProfile.Profile()
+            try:
+                g.perfil.enable()
+            except ValueError:  # outro profiler já ativo neste interpretador
+                g.perfil = None
+        with medir_tempo("sgv_etapa_segundos", etapa="verificar_reset_diario"):
+            verificar_reset_diario()
+
+@app.after_request
+def after_request(resposta):
+    """Registra a duração da requisição."""
+    inicio = g.get("inicio_requisicao")
+    if inicio is None:
+        return resposta
+    observar("sgv_requisicao_segundos", time.perf_counter() - inicio, rota=request.endpoint or "desconhecida",
+             metodo=request.method, status=resposta.status_code)
+    return resposta
+
+@app.teardown_request
+def teardown_request(erro=None):
+    """Desliga o profiler (mesmo se a view levantou exceção) e salva o perfil das lentas."""
+    inicio = g.pop("inicio_requisicao", None)
+    perfil = g.pop("perfil", None)
+    if not perfil:
+        return
+    perfil.disable()
+    duracao = time.perf_counter() - inicio
+    if duracao >= PERFIL_LENTO:
+        try:
+            os.makedirs(PASTA_PERFIS, exist_ok=True)
+            arquivo = os.path.join(PASTA_PERFIS, f"{datetime.now():%Y%m%d_%H%M%S_%f}_{request.endpoint}.prof")
+            perfil.dump_stats(arquivo)
+            registrar_log(f"Requisição lenta ({duracao:.2f}s) {request.method} {request.path}: perfil em {arquivo}")
+        except OSError as e:
+            registrar_log(f"Erro ao salvar perfil: {str(e)}")
+
+def _inicio_template(sender, template, context, **extra):
+    g.inicio_template = time.perf_counter()
+
+def _fim_template(sender, template, context, **extra):
+    inicio = g.pop("inicio_template", None)
+    if inicio is not None:
+        observar("sgv_template_segundos", time.perf_counter() - inicio, template=template.name)
+
+before_render_template.connect(_inicio_template, app)
+template_rendered.connect(_fim_template, app)
+
+@app.route('/metrics')
+def metrics():
+    return Response(formatar_metricas(), mimetype="text/plain; version=0.0.4; charset=utf-8")
 
 @app.route('/')
 def index():
@@ -731,7 +3041,8 @@ def cadastrar_produto_route():
             valor = request.form.get('valor')
             controlar_estoque = request.form.get('controlar_estoque') == 'sim'
             quantidade = request.form.get('quantidade', 0) if controlar_estoque else 0
-            mensagem = cadastrar_produto(produtos, nome, tipo, valor, controlar_estoque, quantidade)
+            with bloqueio_arquivo("estoque.xlsx"):
+                mensagem = cadastrar_produto(obter_produtos(), nome, tipo, valor, controlar_estoque, quantidade)
             flash(mensagem)
             return redirect(url_for('index'))
         return render_template('cadastrar_produto.html')
@@ -743,22 +3054,69 @@ def cadastrar_produto_route():
 @app.route('/remover_produto/<int:produto_id>', methods=['POST'])
 def remover_produto_route(produto_id):
     try:
-        mensagem = remover_produto(produtos, produto_id)
+        with bloqueio_arquivo("estoque.xlsx"):
+            mensagem = remover_produto(obter_produtos(), produto_id)
         flash(mensagem)
         return redirect(url_for('listar_produtos_route'))
     except Exception as e:
         flash(f"Erro: {str(e)}")
         return redirect(url_for('listar_produtos_route'))
 
+@app.route('/matriz')
+def matriz_route():
+    try:
+        produtos_atuais = obter_produtos()
+        matriz = obter_matriz()
+        return render_template('matriz.html',
+                             matriz=dados_matriz(produtos_atuais, matriz),
+                             prateleiras=range(1, matriz.prateleiras + 1),
+                             sem_posicao=len(matriz.sem_posicao),
+                             criterios=CRITERIOS_MATRIZ)
+    except Exception as e:
+        registrar_log(f"Erro na rota matriz: {str(e)}")
+        flash(f"Erro: {str(e)}")
+        return redirect(url_for('index'))
+
+@app.route('/matriz/reorganizar', methods=['POST'])
+def reorganizar_matriz_route():
+    try:
+        criterio = request.form.get('criterio') or None
+        if criterio is not None and criterio not in CRITERIOS_MATRIZ:
+            flash("Erro: Critério inválido!")
+            return redirect(url_for('matriz_route'))
+        with bloqueio_arquivo("estoque.xlsx"):
+            mensagem = reorganizar_matriz(obter_produtos(), criterio)
+        flash(mensagem)
+        return redirect(url_for('matriz_route'))
+    except Exception as e:
+        registrar_log(f"Erro na rota reorganizar_matriz: {str(e)}")
+        flash(f"Erro: {str(e)}")
+        return redirect(url_for('matriz_route'))
+
 @app.route('/produtos')
 def listar_produtos_route():
     try:
-        return render_template('produtos.html', produtos=produtos)
+        ordem = request.args.get('ordem', 'id')
+        if ordem not in ('id', 'nome', 'valor'):
+            ordem = 'id'
+        pagina, proximo = paginar_registros(obter_produtos(), ordem, request.args.get('apos'),
+                                            limite_da_requisicao(TAMANHO_PAGINA, TAMANHO_MAXIMO_PAGINA))
+        return render_template('produtos.html', produtos=pagina, ordem=ordem, proximo=proximo)
     except Exception as e:
         registrar_log(f"Erro na rota produtos: {str(e)}")
         flash(f"Erro: {str(e)}")
         return redirect(url_for('index'))
 
+@app.route('/buscar_produtos')
+def buscar_produtos_route():
+    termo = request.args.get('q', '')
+    limite = limite_da_requisicao(10, LIMITE_MAXIMO_BUSCA)
+    resultados = pesquisar(obter_produtos(), termo, limite)
+    return jsonify([
+        {"id": p["id"], "nome": p["nome"], "tipo": p["tipo"], "valor": p["valor"]}
+        for p in resultados
+    ])
+
 @app.route('/cadastrar_cliente', methods=['GET', 'POST'])
 def cadastrar_cliente_route():
     try:
@@ -767,7 +3125,8 @@ def cadastrar_cliente_route():
             telefone = request.form.get('telefone', '')
             observacoes = request.form.get('observacoes', '')
             
-            mensagem = cadastrar_cliente(clientes, nome, telefone, observacoes)
+            with bloqueio_arquivo("vendas.xlsx"):
+                mensagem = cadastrar_cliente(obter_clientes(), nome, telefone, observacoes)
             flash(mensagem)
             return redirect(url_for('index'))
         
@@ -781,7 +3140,8 @@ def cadastrar_cliente_route():
 @app.route('/remover_cliente/<int:cliente_id>', methods=['POST'])
 def remover_cliente_route(cliente_id):
     try:
-        mensagem = remover_cliente(clientes, cliente_id)
+        with bloqueio_arquivo("vendas.xlsx"):
+            mensagem = remover_cliente(obter_clientes(), cliente_id)
         flash(mensagem)
         return redirect(url_for('listar_clientes_route'))
     except Exception as e:
@@ -792,17 +3152,32 @@ def remover_cliente_route(cliente_id):
 @app.route('/clientes')
 def listar_clientes_route():
     try:
-        clientes_atualizados = carregar_clientes()
-        return render_template('clientes.html', clientes=clientes_atualizados)
+        ordem = request.args.get('ordem', 'id')
+        if ordem not in ('id', 'nome'):
+            ordem = 'id'
+        pagina, proximo = paginar_registros(obter_clientes(), ordem, request.args.get('apos'),
+                                            limite_da_requisicao(TAMANHO_PAGINA, TAMANHO_MAXIMO_PAGINA))
+        return render_template('clientes.html', clientes=pagina, ordem=ordem, proximo=proximo)
     except Exception as e:
         registrar_log(f"Erro na rota listar_clientes: {str(e)}")
         flash(f"Erro: {str(e)}")
         return redirect(url_for('index'))
 
+@app.route('/buscar_clientes')
+def buscar_clientes_route():
+    termo = request.args.get('q', '')
+    limite = limite_da_requisicao(10, LIMITE_MAXIMO_BUSCA)
+    resultados = pesquisar(obter_clientes(), termo, limite)
+    return jsonify([
+        {"id": c["id"], "nome": c["nome"], "telefone": c.get("telefone", ""),
+         "url": url_for('cliente_detalhes', cliente_id=c["id"])}
+        for c in resultados
+    ])
+
 @app.route('/cliente/<int:cliente_id>')
 def cliente_detalhes(cliente_id):
     try:
-        cliente = next((c for c in clientes if c["id"] == cliente_id), None)
+        cliente = buscar_por_id(obter_clientes(), cliente_id)
         if not cliente:
             flash("Cliente não encontrado!")
             return redirect(url_for('listar_clientes_route'))
@@ -810,13 +3185,15 @@ def cliente_detalhes(cliente_id):
         inicializar_carrinho()
         session['cliente_id_carrinho'] = cliente_id
         
-        vendas_cliente = [v for v in carregar_vendas_diarias() if v.get("Cliente_ID") == cliente_id]
-        total_carrinho = sum(item["valor_total"] for item in session.get('carrinho', []))
+        df_vendas = obter_vendas_diarias_df()
+        vendas_cliente = df_vendas[df_vendas["Cliente_ID"] == cliente_id].to_dict('records')
+        carrinho = carregar_carrinho(obter_produtos(), session['carrinho_id'])
+        total_carrinho = sum(item["valor_total"] for item in carrinho)
         
         return render_template('cliente_detalhes.html', 
                              cliente=cliente, 
-                             produtos=produtos, 
-                             carrinho=session.get('carrinho', []),
+                             produtos=obter_produtos(), 
+                             carrinho=carrinho,
                              total_carrinho=total_carrinho,
                              vendas_cliente=vendas_cliente)
     except Exception as e:
@@ -836,12 +3213,10 @@ def adicionar_carrinho():
         produto_id = int(request.form.get('produto_id'))
         quantidade = request.form.get('quantidade')
         
-        item, erro = adicionar_item_carrinho(produtos, produto_id, quantidade)
+        item, erro = adicionar_item_carrinho(obter_produtos(), produto_id, quantidade, session['carrinho_id'])
         if erro:
             flash(erro)
         else:
-            session['carrinho'].append(item)
-            session.modified = True
             flash(f"Adicionado: {item['descricao']} - R$ {item['valor_total']:.2f}")
         
         return redirect(url_for('cliente_detalhes', cliente_id=cliente_id))
@@ -854,18 +3229,24 @@ def adicionar_carrinho():
 def finalizar_pedido_route():
     try:
         cliente_id = session.get('cliente_id_carrinho')
-        carrinho = session.get('carrinho', [])
+        carrinho_id = session.get('carrinho_id')
         forma_pagamento = request.form.get('forma_pagamento', 'pendente')
         
         if not cliente_id:
             flash("Nenhum cliente selecionado!")
             return redirect(url_for('listar_clientes_route'))
         
-        mensagem = finalizar_pedido(clientes, produtos, cliente_id, carrinho, forma_pagamento)
+        with bloqueio_arquivo("estoque.xlsx"):
+            produtos_atuais = obter_produtos()
+            carrinho = carregar_carrinho(produtos_atuais, carrinho_id)
+            mensagem = finalizar_pedido(obter_clientes(), produtos_atuais, cliente_id, carrinho,
+                                        forma_pagamento, carrinho_id)
         flash(mensagem)
+        if mensagem.startswith("Erro"):
+            return redirect(url_for('cliente_detalhes', cliente_id=cliente_id))
         
-        session['carrinho'] = []
         session['cliente_id_carrinho'] = None
+        session['carrinho_id'] = None
         session.modified = True
         
         return redirect(url_for('index'))
@@ -874,12 +3255,62 @@ def finalizar_pedido_route():
         flash(f"Erro: {str(e)}")
         return redirect(url_for('index'))
 
+@app.route('/api/pedidos', methods=['POST'])
+def api_pedidos():
+    """Recebe um pedido {cliente_id, forma_pagamento, itens} ou um lote {pedidos: [...]}."""
+    dados = request.get_json(silent=True)
+    if isinstance(dados, dict) and "pedidos" in dados:
+        pedidos = dados["pedidos"]
+    elif isinstance(dados, dict):
+        pedidos = [dados]
+    else:
+        pedidos = dados
+    if not isinstance(pedidos, list) or not pedidos:
+        return jsonify({"erro": "Envie um pedido ou {\"pedidos\": [...]} em JSON."}), 400
+    if len(pedidos) > LIMITE_PEDIDOS_POR_LOTE:
+        return jsonify({"erro": f"Máximo de {LIMITE_PEDIDOS_POR_LOTE} pedidos por lote."}), 413
+    
+    try:
+        with bloqueio_arquivo("estoque.xlsx"):
+            resultados = finalizar_pedidos(obter_clientes(), obter_produtos(), pedidos)
+    except Exception as e:
+        registrar_log(f"Erro na API de pedidos: {str(e)}")
+        return jsonify({"erro": str(e)}), 500
+    
+    aceitos = sum(1 for r in resultados if r["ok"])
+    return jsonify({"aceitos": aceitos, "recusados": len(resultados) - aceitos, "resultados": resultados})
+
+@app.route('/api/sincronizar', methods=['POST'])
+def api_sincronizar():
+    """Recebe a fila offline de um terminal: {terminal, vendas: [{chave, cliente_id, ..., data, itens}]}."""
+    dados = request.get_json(silent=True)
+    pedidos = dados.get("vendas") if isinstance(dados, dict) else None
+    if not isinstance(pedidos, list) or not pedidos:
+        return jsonify({"erro": "Envie {\"vendas\": [...]} em JSON."}), 400
+    if len(pedidos) > LIMITE_VENDAS_POR_SINCRONIZACAO:
+        return jsonify({"erro": f"Máximo de {LIMITE_VENDAS_POR_SINCRONIZACAO} vendas por lote."}), 413
+    
+    try:
+        with bloqueio_arquivo("estoque.xlsx"):
+            resultados, estoque_negativo = sincronizar_vendas(obter_clientes(), obter_produtos(), pedidos,
+                                                              dados.get("terminal"))
+    except Exception as e:
+        registrar_log(f"Erro na sincronização: {str(e)}")
+        return jsonify({"erro": str(e)}), 500
+    
+    return jsonify({
+        "aplicadas": sum(1 for r in resultados if r["ok"] and not r.get("duplicado")),
+        "duplicadas": sum(1 for r in resultados if r.get("duplicado")),
+        "recusadas": sum(1 for r in resultados if not r["ok"] and not r.get("duplicado")),
+        "resultados": resultados,
+        "estoque_negativo": estoque_negativo
+    })
+
 @app.route('/limpar_carrinho', methods=['POST'])
 def limpar_carrinho():
     try:
         cliente_id = session.get('cliente_id_carrinho')
-        session['carrinho'] = []
-        session.modified = True
+        esvaziar_carrinho(session.get('carrinho_id'))
         flash("Carrinho limpo!")
         if cliente_id:
             return redirect(url_for('cliente_detalhes', cliente_id=cliente_id))
@@ -912,16 +3343,15 @@ def fechamento_caixa_route():
             
             return redirect(url_for('fechamento_caixa_route'))
         
-        vendas = carregar_vendas_diarias()
-        fechamentos = carregar_fechamentos_caixa()
+        fechamentos = obter_fechamentos_caixa()
         data_hoje = obter_data_atual()
         
-        total_dia = sum(v.get("Valor_Total", 0) for v in vendas)
-        total_pago_dia = sum(v.get("Valor_Total", 0) for v in vendas if v.get("Status_Pagamento") == "Pago")
-        total_pendente_dia = total_dia - total_pago_dia
+        resumo = obter_resumo_dia(data_hoje) or {}
+        total_dia = resumo.get("Total_Vendas", 0)
+        total_pago_dia = resumo.get("Total_Pago", 0)
+        total_pendente_dia = resumo.get("Total_Pendente", 0)
         
         return render_template('fechamento_caixa.html', 
-                             vendas=vendas, 
                              fechamentos=fechamentos,
                              data_hoje=data_hoje,
                              total_dia=total_dia,
@@ -942,10 +3372,12 @@ def gastos_route():
             valor = request.form.get('valor')
             data_vencimento = request.form.get('data_vencimento')
             quantidade = request.form.get('quantidade')
-            mensagem = cadastrar_gasto(gastos, tipo_gasto, descricao, valor, data_vencimento, quantidade)
+            with bloqueio_arquivo("gastos.xlsx"):
+                mensagem = cadastrar_gasto(obter_gastos(), tipo_gasto, descricao, valor, data_vencimento, quantidade)
             flash(mensagem)
             return redirect(url_for('gastos_route'))
         
+        gastos = obter_gastos()
         total_fixos = sum(g["Valor"] for g in gastos["fixos"])
         total_variaveis = sum(g["Valor"] * g.get("Quantidade", 1) for g in gastos["variaveis"])
         
@@ -961,7 +3393,8 @@ def gastos_route():
 @app.route('/remover_gasto/<tipo_gasto>/<int:gasto_id>', methods=['POST'])
 def remover_gasto_route(tipo_gasto, gasto_id):
     try:
-        mensagem = remover_gasto(gastos, tipo_gasto, gasto_id)
+        with bloqueio_arquivo("gastos.xlsx"):
+            mensagem = remover_gasto(obter_gastos(), tipo_gasto, gasto_id)
         flash(mensagem)
         return redirect(url_for('gastos_route'))
     except Exception as e:
@@ -971,30 +3404,167 @@ def remover_gasto_route(tipo_gasto, gasto_id):
 @app.route('/relatorios')
 def relatorios():
     try:
-        vendas_diarias = carregar_vendas_diarias()
-        total_geral = sum(v.get("Valor_Total", 0) for v in vendas_diarias)
+        limite = limite_da_requisicao(LIMITE_VENDAS_POR_CLIENTE, TAMANHO_MAXIMO_PAGINA)
+        apos = request.args.get('apos')
+        df = obter_vendas_diarias_df()
+        total_geral = float(df["Valor_Total"].sum()) if not df.empty else 0
         
         vendas_por_cliente = {}
-        for venda in vendas_diarias:
-            cliente = venda.get("Cliente_Nome", "Desconhecido")
-            if cliente not in vendas_por_cliente:
-                vendas_por_cliente[cliente] = {"vendas": [], "total": 0}
-            vendas_por_cliente[cliente]["vendas"].append(venda)
-            vendas_por_cliente[cliente]["total"] += venda.get("Valor_Total", 0)
+        proximo = None
+        if not df.empty:
+            nomes = df["Cliente_Nome"].fillna("Desconhecido").astype(str)
+            grupos = df.groupby(nomes, sort=True)
+            totais = grupos["Valor_Total"].sum()
+            quantidades = grupos.size()
+            if apos:
+                totais = totais[totais.index > apos]
+            if len(totais) > CLIENTES_POR_PAGINA_RELATORIO:
+                totais = totais.iloc[:CLIENTES_POR_PAGINA_RELATORIO]
+                proximo = totais.index[-1]
+            df = df[nomes.isin(totais.index)]
+            nomes = nomes.loc[df.index]
+            grupos = df.groupby(nomes, sort=False)
+            for cliente, total in totais.items():
+                vendas_por_cliente[cliente] = {
+                    "vendas": [],
+                    "total": float(total),
+                    "ocultas": max(int(quantidades[cliente]) - limite, 0)
+                }
+            exibidas = grupos.head(limite)
+            for cliente, venda in zip(nomes.loc[exibidas.index], exibidas.to_dict('records')):
+                vendas_por_cliente[cliente]["vendas"].append(venda)
         
         return render_template('relatorios.html', 
-                             vendas_diarias=vendas_diarias, 
                              total_geral=total_geral,
-                             vendas_por_cliente=vendas_por_cliente)
+                             vendas_por_cliente=vendas_por_cliente,
+                             limite=limite,
+                             proximo=proximo)
     except Exception as e:
         registrar_log(f"Erro na rota relatorios: {str(e)}")
         flash(f"Erro: {str(e)}")
         return redirect(url_for('index'))
 
+@app.route('/vendas_dia')
+def vendas_dia_route():
+    """Listagem completa das vendas do dia, enviada em partes conforme é gerada."""
+    try:
+        data_hoje = obter_data_atual()
+        return stream_template('vendas_dia.html',
+                               vendas=iterar_vendas_diarias(),
+                               data_hoje=data_hoje,
+                               resumo=obter_resumo_dia(data_hoje) or {})
+    except Exception as e:
+        registrar_log(f"Erro na rota vendas_dia: {str(e)}")
+        flash(f"Erro: {str(e)}")
+        return redirect(url_for('index'))
+
+@app.route('/vendas_periodo')
+def vendas_periodo_route():
+    try:
+        periodo = request.args.get('periodo', 'dia')
+        if periodo not in PERIODOS_RESUMO:
+            periodo = 'dia'
+        
+        periodos = obter_resumo_periodos(periodo, limite=limite_da_requisicao(12, TAMANHO_MAXIMO_PAGINA))
+        chave_periodo = request.args.get('chave') or (periodos[0]["Chave_Periodo"] if periodos else None)
+        
+        ranking_produtos = []
+        ranking_clientes = []
+        if chave_periodo:
+            ranking_produtos = obter_ranking_periodo(periodo, chave_periodo, 'produto')
+            ranking_clientes = obter_ranking_periodo(periodo, chave_periodo, 'cliente')
+        
+        return render_template('vendas_periodo.html',
+                             periodo=periodo,
+                             periodos=periodos,
+                             chave_periodo=chave_periodo,
+                             ranking_produtos=ranking_produtos,
+                             ranking_clientes=ranking_clientes)
+    except Exception as e:
+        registrar_log(f"Erro na rota vendas_periodo: {str(e)}")
+        flash(f"Erro: {str(e)}")
+        return redirect(url_for('index'))
+
+@app.route('/desempenho')
+def desempenho_route():
+    try:
+        janela = request.args.get('dias', 30, type=int)
+        if janela not in JANELAS_DESEMPENHO:
+            janela = 30
+        return render_template('desempenho.html',
+                               desempenhos=desempenho_produtos(obter_produtos(), janela),
+                               janela=janela,
+                               janelas=JANELAS_DESEMPENHO)
+    except Exception as e:
+        registrar_log(f"Erro na rota desempenho: {str(e)}")
+        flash(f"Erro: {str(e)}")
+        return redirect(url_for('index'))
+
+LIMITE_RECUSAS_EXIBIDAS = 200
+
+@app.route('/importar', methods=['GET', 'POST'])
+def importar():
+    try:
+        if request.method == 'POST':
+            conjunto = request.form.get('conjunto')
+            arquivo = request.files.get('arquivo')
+            if not arquivo or not arquivo.filename:
+                flash("Erro: Selecione um arquivo!")
+                return redirect(url_for('importar'))
+            importados, recusadas = importar_arquivo(conjunto, arquivo.stream, arquivo.filename)
+            flash(f"{importados} {conjunto} importados, {len(recusadas)} linhas recusadas.")
+            return render_template('importar.html', recusadas=recusadas[:LIMITE_RECUSAS_EXIBIDAS],
+                                   total_recusadas=len(recusadas))
+        return render_template('importar.html', recusadas=[], total_recusadas=0)
+    except Exception as e:
+        registrar_log(f"Erro na importação: {str(e)}")
+        flash(f"Erro: {str(e)}")
+        return redirect(url_for('importar'))
+
+@app.route('/exportar')
+def exportar():
+    return render_template('exportar.html', data_hoje=obter_data_atual())
+
+@app.route('/exportar/vendas')
+def exportar_vendas():
+    try:
+        data_inicio = request.args.get('data_inicio') or None
+        data_fim = request.args.get('data_fim') or None
+        for data in (data_inicio, data_fim):
+            if data:
+                date.fromisoformat(data)
+        cliente_id = request.args.get('cliente_id', type=int)
+        linhas = iterar_vendas(data_inicio, data_fim, cliente_id)
+        return resposta_exportacao("vendas", COLUNAS_VENDA, linhas, request.args.get('formato'))
+    except ValueError:
+        flash("Data inválida!")
+        return redirect(url_for('exportar'))
+    except Exception as e:
+        registrar_log(f"Erro ao exportar vendas: {str(e)}")
+        flash(f"Erro: {str(e)}")
+        return redirect(url_for('exportar'))
+
+@app.route('/exportar/<conjunto>')
+def exportar_conjunto(conjunto):
+    conjuntos = {
+        "clientes": (COLUNAS_CLIENTE, linhas_clientes),
+        "produtos": (COLUNAS_PRODUTO, linhas_produtos),
+        "gastos": (COLUNAS_GASTO, linhas_gastos),
+    }
+    if conjunto not in conjuntos:
+        flash("Exportação desconhecida!")
+        return redirect(url_for('exportar'))
+    colunas, linhas = conjuntos[conjunto]
+    return resposta_exportacao(conjunto, colunas, linhas(), request.args.get('formato'))
+
 @app.route('/fechamento_mensal')
 def fechamento_mensal_route():
     try:
-        mensagem = fechamento_mensal()
+        mensagem = executar_fechamento(
+            request.args.get('mes'), request.args.get('ano'),
+            request.args.get('inicio'), request.args.get('fim'),
+            request.args.get('recalcular') == '1'
+        )
         flash(mensagem)
         return redirect(url_for('index'))
     except Exception as e:
@@ -1004,7 +3574,12 @@ def fechamento_mensal_route():
 @app.route('/listar')
 def listar():
     try:
-        return render_template('listar.html', produtos=produtos)
+        ordem = request.args.get('ordem', 'id')
+        if ordem not in ('id', 'nome', 'valor'):
+            ordem = 'id'
+        pagina, proximo = paginar_registros(obter_produtos(), ordem, request.args.get('apos'),
+                                            limite_da_requisicao(TAMANHO_PAGINA, TAMANHO_MAXIMO_PAGINA))
+        return render_template('listar.html', produtos=pagina, ordem=ordem, proximo=proximo)
     except Exception as e:
         flash(f"Erro: {str(e)}")
         return redirect(url_for('index'))
@@ -1012,9 +3587,12 @@ def listar():
 @app.route('/salvar')
 def salvar():
     try:
-        salvar_produtos(produtos)
-        salvar_clientes(clientes)
-        salvar_gastos(gastos)
+        with bloqueio_arquivo("estoque.xlsx"):
+            salvar_produtos(obter_produtos())
+        with bloqueio_arquivo("vendas.xlsx"):
+            salvar_clientes(obter_clientes())
+        with bloqueio_arquivo("gastos.xlsx"):
+            salvar_gastos(obter_gastos())
         return render_template('salvar.html')
     except Exception as e:
         flash(f"Erro: {str(e)}")
@@ -0,0 +1,126 @@
+"""Gera estoque.xlsx, vendas.xlsx e gastos.xlsx sintéticos para testes de carga.
+
+Uso: python benchmarks/gerar_dados.py PASTA [--clientes N] [--produtos M] [--dias K]
+                                            [--vendas-por-dia V] [--semente S]
+
+O vendas.xlsx sai no formato antigo (abas Clientes, Diario e Historico_Vendas):
+na primeira execução o app migra as vendas para o vendas.db. O Diario recebe
+as vendas de hoje e o Historico_Vendas as dos K dias anteriores.
+"""
+import argparse
+import os
+import random
+from datetime import date, timedelta
+
+from openpyxl import Workbook
+
+PRIMEIROS_NOMES = ["Ana", "Bruno", "Carla", "Daniel", "Eduarda", "Felipe", "Gabriela", "Heitor",
+                   "Isabela", "João", "Karina", "Lucas", "Mariana", "Nicolas", "Otávio", "Paula",
+                   "Rafael", "Sofia", "Tiago", "Vitória"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira",
+              "Lima", "Gomes", "Costa", "Ribeiro", "Martins", "Carvalho", "Araújo", "Melo"]
+PRODUTOS_BASE = [("Pão Francês", "esteira", 0.5), ("Bolo de Fubá", "quilo", 22.0),
+                 ("Sonho", "unitario", 4.5), ("Rosca Doce", "unitario", 12.0),
+                 ("Pão de Queijo", "quilo", 38.0), ("Broa de Milho", "unitario", 3.0),
+                 ("Torta de Frango", "quilo", 45.0), ("Pão de Forma", "unitario", 9.5)]
+FORMAS_PAGAMENTO = ["pix", "cartao", "dinheiro", "deposito", "pendente"]
+COLUNAS_VENDA = ["Cliente_ID", "Cliente_Nome", "Produto_Nome", "Tipo_Produto", "Quantidade_Input",
+                 "Quantidade_Total", "Valor_Unitario", "Valor_Total", "Forma_Pagamento",
+                 "Status_Pagamento", "Data"]
+
+
+def gerar_clientes(quantidade, aleatorio):
+    clientes = []
+    for i in range(1, quantidade + 1):
+        nome = f"{aleatorio.choice(PRIMEIROS_NOMES)} {aleatorio.choice(SOBRENOMES)} {i}"
+        clientes.append([i, nome, f"(11) 9{aleatorio.randint(1000, 9999)}-{aleatorio.randint(1000, 9999)}", ""])
+    return clientes
+
+
+def gerar_produtos(quantidade, aleatorio):
+    produtos = []
+    for i in range(1, quantidade + 1):
+        nome, tipo, valor = PRODUTOS_BASE[(i - 1) % len(PRODUTOS_BASE)]
+        if i > len(PRODUTOS_BASE):
+            nome = f"{nome} {i}"
+            valor = round(valor * aleatorio.uniform(0.8, 1.3), 2)
+        controlar = tipo == "unitario"
+        produtos.append([i, nome, tipo, valor, controlar, 100000 if controlar else 0])
+    return produtos
+
+
+def gerar_venda(clientes, produtos, data, aleatorio):
+    cliente = aleatorio.choice(clientes)
+    produto = aleatorio.choice(produtos)
+    _, nome, tipo, valor, _, _ = produto
+    quantidade_input = aleatorio.randint(1, 5) if tipo != "quilo" else round(aleatorio.uniform(0.2, 3.0), 2)
+    quantidade_total = quantidade_input * 30 if tipo == "esteira" else quantidade_input
+    forma = aleatorio.choice(FORMAS_PAGAMENTO)
+    return [cliente[0], cliente[1], nome, tipo, quantidade_input, quantidade_total, valor,
+            round(quantidade_total * valor, 2), forma, "Pendente" if forma == "pendente" else "Pago",
+            data.isoformat()]
+
+
+def gerar_dados(pasta, clientes=500, produtos=80, dias=90, vendas_por_dia=60, semente=42):
+    """Grava os três arquivos em `pasta` e retorna o total de vendas geradas."""
+    aleatorio = random.Random(semente)
+    os.makedirs(pasta, exist_ok=True)
+    lista_clientes = gerar_clientes(clientes, aleatorio)
+    lista_produtos = gerar_produtos(produtos, aleatorio)
+    hoje = date.today()
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Produtos")
+    ws.append(["ID", "Nome", "Tipo", "Valor", "Controlar_Estoque", "Quantidade"])
+    for produto in lista_produtos:
+        ws.append(produto)
+    wb.save(os.path.join(pasta, "estoque.xlsx"))
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Clientes")
+    ws.append(["ID", "Nome", "Telefone", "Observacoes"])
+    for cliente in lista_clientes:
+        ws.append(cliente)
+    ws = wb.create_sheet("Diario")
+    ws.append(COLUNAS_VENDA)
+    for _ in range(vendas_por_dia):
+        ws.append(gerar_venda(lista_clientes, lista_produtos, hoje, aleatorio))
+    ws = wb.create_sheet("Historico_Vendas")
+    ws.append(COLUNAS_VENDA)
+    for dia in range(dias, 0, -1):
+        data = hoje - timedelta(days=dia)
+        for _ in range(vendas_por_dia):
+            ws.append(gerar_venda(lista_clientes, lista_produtos, data, aleatorio))
+    wb.save(os.path.join(pasta, "vendas.xlsx"))
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Gastos_Fixos")
+    ws.append(["ID", "Descricao", "Valor", "Data_Vencimento"])
+    for i, (descricao, valor) in enumerate([("Aluguel", 3500), ("Energia", 900), ("Internet", 150)], 1):
+        ws.append([i, descricao, valor, hoje.replace(day=10).isoformat()])
+    ws = wb.create_sheet("Gastos_Variaveis")
+    ws.append(["ID", "Descricao", "Valor", "Quantidade", "Data"])
+    for i in range(1, dias + 1):
+        ws.append([i, "Farinha (saco 25kg)", 95.0, aleatorio.randint(1, 4), (hoje - timedelta(days=i)).isoformat()])
+    wb.save(os.path.join(pasta, "gastos.xlsx"))
+
+    with open(os.path.join(pasta, "ultima_data.txt"), "w") as f:
+        f.write(hoje.isoformat())
+    return vendas_por_dia * (dias + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pasta")
+    parser.add_argument("--clientes", type=int, default=500)
+    parser.add_argument("--produtos", type=int, default=80)
+    parser.add_argument("--dias", type=int, default=90)
+    parser.add_argument("--vendas-por-dia", type=int, default=60)
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+    total = gerar_dados(args.pasta, args.clientes, args.produtos, args.dias, args.vendas_por_dia, args.semente)
+    print(f"{args.clientes} clientes, {args.produtos} produtos, {total} vendas em {args.pasta}")
+
+
+if __name__ == "__main__":
+    main()
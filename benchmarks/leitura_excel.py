@@ -0,0 +1,82 @@
+"""Compara o tempo de leitura de uma aba Historico_Vendas grande.
+
+Uso: python benchmarks/leitura_excel.py [linhas]   (padrão: 100000)
+
+Gera uma planilha sintética (no formato antigo do vendas.xlsx) numa pasta
+temporária e mede:
+  - pd.read_excel padrão (uma abertura por aba, como o app fazia antes);
+  - ler_planilha do app (openpyxl read_only, uma abertura para todas as abas);
+  - ler_planilha com o motor calamine, se o python-calamine estiver instalado.
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from openpyxl import Workbook
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def gerar_planilha(caminho, linhas):
+    """Cria a planilha com Clientes, Fechamento_Caixa e um Historico_Vendas de `linhas` linhas."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Clientes")
+    ws.append(["ID", "Nome", "Telefone", "Observacoes"])
+    for i in range(1, 501):
+        ws.append([i, f"Cliente {i}", f"1199{i:05d}", ""])
+    ws = wb.create_sheet("Fechamento_Caixa")
+    ws.append(["Data", "Total_Vendas", "Total_Pago", "Total_Pendente", "PIX", "Cartao",
+               "Deposito", "Dinheiro", "Total_Recebido", "Diferenca"])
+    ws = wb.create_sheet("Historico_Vendas")
+    ws.append(["Cliente_ID", "Cliente_Nome", "Produto_Nome", "Tipo_Produto", "Quantidade_Input",
+               "Quantidade_Total", "Valor_Unitario", "Valor_Total", "Forma_Pagamento",
+               "Status_Pagamento", "Data"])
+    for i in range(linhas):
+        cliente = i % 500 + 1
+        ws.append([cliente, f"Cliente {cliente}", f"Produto {i % 80}", "unitario", 2, 2, 3.5, 7.0,
+                   "pix", "Pago", f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}"])
+    wb.save(caminho)
+
+
+def medir(descricao, funcao):
+    inicio = time.perf_counter()
+    resultado = funcao()
+    duracao = time.perf_counter() - inicio
+    print(f"{descricao:<45} {duracao:8.2f} s")
+    return resultado
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    abas = ["Clientes", "Fechamento_Caixa", "Historico_Vendas"]
+
+    with tempfile.TemporaryDirectory() as pasta:
+        os.chdir(pasta)
+        print(f"Gerando planilha.xlsx com {linhas} linhas de histórico...")
+        gerar_planilha("planilha.xlsx", linhas)
+
+        import app
+
+        medir("pd.read_excel (uma abertura por aba)",
+              lambda: {aba: pd.read_excel("planilha.xlsx", sheet_name=aba) for aba in abas})
+
+        motor = app.MOTOR_EXCEL
+        app.MOTOR_EXCEL = None
+        lidas = medir("ler_planilha (openpyxl read_only)", lambda: app.ler_planilha("planilha.xlsx", abas))
+        assert len(lidas["Historico_Vendas"]) == linhas
+
+        if motor:
+            app.MOTOR_EXCEL = motor
+            medir(f"ler_planilha ({motor})", lambda: app.ler_planilha("planilha.xlsx", abas))
+        else:
+            print("python-calamine não instalado; motor calamine não medido.")
+
+        app.encerrar_log()
+        os.chdir(RAIZ)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Mede os caminhos mais usados do app em várias escalas de dados.
+
+Uso: python benchmarks/rotas.py [--escalas 200x40x30,2000x200x90] [--vendas-por-dia V]
+                                [--repeticoes R]
+
+Cada escala é CLIENTESxPRODUTOSxDIAS. Para cada uma, os dados são gerados com
+gerar_dados.py numa pasta temporária e as rotas são chamadas pelo test client
+do Flask num processo novo (o app guarda estado em variáveis de módulo). A
+tabela final mostra a mediana em milissegundos de cada operação por escala.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+PASTA_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(PASTA_BENCHMARKS)
+sys.path.insert(0, PASTA_BENCHMARKS)
+
+from gerar_dados import gerar_dados
+
+
+def medir_rotas(pasta, repeticoes):
+    """Roda dentro do processo filho: retorna {operação: [ms, ...]}."""
+    os.chdir(pasta)
+    sys.path.insert(0, RAIZ)
+    resultados = {}
+
+    inicio = time.perf_counter()
+    import app
+    resultados["carga inicial (import + migração)"] = [(time.perf_counter() - inicio) * 1000]
+
+    cliente = app.app.test_client()
+    produto_id = next(p["id"] for p in app.obter_produtos() if p["tipo"] == "unitario")
+    hoje = date.today().isoformat()
+
+    def medir(nome, funcao, vezes=repeticoes, preparar=None):
+        tempos = []
+        for _ in range(vezes):
+            if preparar:
+                preparar()
+            inicio = time.perf_counter()
+            resposta = funcao()
+            if resposta is not None:
+                resposta.get_data()
+                assert resposta.status_code < 400, (nome, resposta.status_code)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        resultados[nome] = tempos
+
+    def adicionar_item():
+        return cliente.post("/adicionar_carrinho", data={"produto_id": produto_id, "quantidade": 1})
+
+    def preparar_pedido():
+        cliente.get("/cliente/1")
+        adicionar_item()
+
+    cliente.get("/cliente/1")
+    medir("carrinho: adicionar item", adicionar_item)
+    cliente.post("/limpar_carrinho")
+    medir("checkout: finalizar pedido", lambda: cliente.post("/finalizar_pedido", data={"forma_pagamento": "pix"}),
+          preparar=preparar_pedido)
+    medir("clientes: listar", lambda: cliente.get("/clientes"))
+    medir("clientes: buscar", lambda: cliente.get("/buscar_clientes?q=silva"))
+    medir("relatórios", lambda: cliente.get("/relatorios"))
+    medir("vendas do dia", lambda: cliente.get("/vendas_dia"))
+    medir("vendas por período", lambda: cliente.get("/vendas_periodo?periodo=mes"))
+    medir("fechamento de caixa", lambda: cliente.post("/fechamento_caixa", data={
+        "data_fechamento": hoje, "pix": 100, "cartao": 50, "deposito": 0, "dinheiro": 20}))
+    medir("fechamento mensal", lambda: cliente.get("/fechamento_mensal"), vezes=1)
+
+    def voltar_um_dia():
+        with open("ultima_data.txt", "w") as f:
+            f.write((date.today() - timedelta(days=1)).isoformat())
+        app._dia_corrente = None
+
+    medir("arquivamento diário", app.verificar_reset_diario, vezes=1, preparar=voltar_um_dia)
+
+    app.encerrar_log()
+    return resultados
+
+
+def rodar_escala(escala, vendas_por_dia, repeticoes):
+    clientes, produtos, dias = (int(parte) for parte in escala.split("x"))
+    with tempfile.TemporaryDirectory() as pasta:
+        total = gerar_dados(pasta, clientes, produtos, dias, vendas_por_dia)
+        print(f"[{escala}] {clientes} clientes, {produtos} produtos, {total} vendas", file=sys.stderr)
+        processo = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--medir", pasta, "--repeticoes", str(repeticoes)],
+            capture_output=True, text=True, check=True
+        )
+        return json.loads(processo.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escalas", default="200x40x30,2000x200x90")
+    parser.add_argument("--vendas-por-dia", type=int, default=60)
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--medir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        print(json.dumps(medir_rotas(args.medir, args.repeticoes)))
+        return
+
+    escalas = args.escalas.split(",")
+    por_escala = {escala: rodar_escala(escala, args.vendas_por_dia, args.repeticoes) for escala in escalas}
+
+    largura = max(len(nome) for resultados in por_escala.values() for nome in resultados)
+    print(f"{'operação (mediana, ms)':<{largura}}" + "".join(f"{escala:>16}" for escala in escalas))
+    for nome in por_escala[escalas[0]]:
+        linha = f"{nome:<{largura}}"
+        for escala in escalas:
+            tempos = por_escala[escala].get(nome)
+            linha += f"{statistics.median(tempos):>16.1f}" if tempos else f"{'-':>16}"
+        print(linha)
+
+
+if __name__ == "__main__":
+    main()